@@ -0,0 +1,773 @@
+#!/usr/bin/python
+
+import os, sys, json, time, re, threading, collections, shutil, subprocess, tempfile, uuid, hashlib, bisect
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+k_usage = """usage: agbench <command> [ --option value ... ]
+
+commands:
+    serve               Run a mock portal until interrupted ( --port )
+    run                 Run the benchmarks against a fresh mock portal
+
+options:
+    --items n           Items in the root folder ( default 10000 )
+    --folders n         Extra folders, each with --folder-items items ( default 10 )
+    --folder-items n    Items per extra folder ( default 100 )
+    --item-size n       Bytes of data per generated item ( default 1024 )
+    --page-size n       Largest page the portal returns ( default 100 )
+    --latency s         Seconds added to every request ( default 0 )
+    --resolve n         Paths resolved by the resolve benchmark ( default 200 )
+    --delete n          Items removed by the delete benchmark ( default 1000 )
+    --transfer-mb n     Size of the upload/download benchmark file ( default 256 )
+    --features n        Features in the export benchmark layer ( default 100000 )
+    --only name,...     Run only the named benchmarks
+    --json              Print results as JSON
+"""
+
+k_username = "bench"
+k_chunk = 65536
+
+def get_options( argv ):
+    parameters = [ ]
+    options = { }
+    i = 0
+    while i < len( argv ):
+        arg = argv[ i ]
+        i += 1
+        if arg == "--json":
+            options[ "json" ] = "true"
+        elif arg.startswith( "--" ):
+            options[ arg[2:] ] = argv[ i ]
+            i += 1
+        else:
+            parameters.append( arg )
+    return parameters, options
+
+def synthetic_bytes( item_id, start, end ):
+    seed = ( item_id * ( 1 + k_chunk // len( item_id ) ) ).encode( "ascii" )[ : k_chunk ]
+    data = [ ]
+    offset = start
+    while offset < end:
+        pos = offset % len( seed )
+        chunk = seed[ pos : pos + end - offset ]
+        data.append( chunk )
+        offset += len( chunk )
+    return b"".join( data )
+
+def parse_multipart( body, content_type ):
+    m = re.search( r"boundary=\"?([^\";]+)\"?", content_type )
+    fields = { }
+    files = { }
+    if m is None:
+        return fields, files
+    boundary = b"--" + m.groups()[0].encode( "ascii" )
+    for part in body.split( boundary )[ 1 : ]:
+        if part.startswith( b"--" ):
+            break
+        header, _, content = part[2:].partition( b"\r\n\r\n" )
+        content = content[ : -2 ] if content.endswith( b"\r\n" ) else content
+        header = header.decode( "utf-8" )
+        name = re.search( r"name=\"([^\"]*)\"", header )
+        if name is None:
+            continue
+        filename = re.search( r"filename=\"([^\"]*)\"", header )
+        if filename is not None:
+            files[ name.groups()[0] ] = ( filename.groups()[0], content )
+        else:
+            fields[ name.groups()[0] ] = content.decode( "utf-8" )
+    return fields, files
+
+class MockPortal:
+
+    def __init__( self, items=10000, folders=10, folder_items=100, item_size=1024, page_size=100, latency=0.0 ):
+        self.page_size = page_size
+        self.latency = latency
+        self.item_size = item_size
+        self.lock = threading.RLock()
+        self.data_dir = tempfile.mkdtemp( prefix="agbench-" )
+        self.tokens = { }
+        self.folders = collections.OrderedDict()
+        self.contents = { "": collections.OrderedDict() }
+        self.items = { }
+        self.parts = { }
+        self.processing = { }
+        self.processing_polls = 0
+        self.truncate_data = 0
+        self.services = { }
+        self.counts = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        for i in range( items ):
+            self.add_item( "", "item" + str( i ), item_size )
+        for i in range( folders ):
+            folder = self.add_folder( "folder" + str( i ) )
+            for j in range( folder_items ):
+                self.add_item( folder[ "id" ], "item" + str( j ), item_size )
+        self.server = None
+        self.url = ""
+
+    def new_id( self ):
+        return uuid.uuid4().hex
+
+    def add_folder( self, title ):
+        folder = { }
+        folder[ "id" ] = self.new_id()
+        folder[ "title" ] = title
+        folder[ "username" ] = k_username
+        folder[ "created" ] = int( time.time() * 1000 )
+        self.folders[ folder[ "id" ] ] = folder
+        self.contents[ folder[ "id" ] ] = collections.OrderedDict()
+        return folder
+
+    def add_item( self, folder_id, title, size=0, fields=None ):
+        now = int( time.time() * 1000 )
+        item = { }
+        item[ "id" ] = self.new_id()
+        item[ "owner" ] = k_username
+        item[ "title" ] = title
+        item[ "name" ] = title + ".txt"
+        item[ "type" ] = "Code Sample"
+        item[ "typeKeywords" ] = [ ]
+        item[ "tags" ] = [ ]
+        item[ "snippet" ] = None
+        item[ "description" ] = None
+        item[ "access" ] = "private"
+        item[ "size" ] = size
+        item[ "created" ] = now
+        item[ "modified" ] = now
+        item[ "ownerFolder" ] = folder_id if folder_id != "" else None
+        for key in ( fields or { } ):
+            if key in [ "tags", "typeKeywords" ]:
+                item[ key ] = [ tag.strip() for tag in fields[ key ].split( "," ) if tag.strip() != "" ]
+            elif key not in [ "f", "token", "multipart", "filename", "text", "folder" ]:
+                item[ key ] = fields[ key ]
+        self.items[ item[ "id" ] ] = item
+        self.contents[ folder_id ][ item[ "id" ] ] = True
+        return item
+
+    def add_feature_service( self, folder_id, title, count, max_record_count=1000 ):
+        item = self.add_item( folder_id, title )
+        item[ "type" ] = "Feature Service"
+        item[ "name" ] = title
+        item[ "service" ] = title
+        service = { }
+        service[ "maxRecordCount" ] = max_record_count
+        service[ "oids" ] = [ oid for oid in range( 1, count + count // 9 + 2 ) if oid % 10 != 0 ][ : count ]
+        self.services[ title ] = service
+        return item
+
+    def data_path( self, item_id ):
+        return os.path.join( self.data_dir, item_id )
+
+    def set_data( self, item, data ):
+        with open( self.data_path( item[ "id" ] ), "wb" ) as out:
+            out.write( data )
+        item[ "size" ] = len( data )
+        item[ "modified" ] = int( time.time() * 1000 )
+
+    def read_data( self, item, start, end ):
+        path = self.data_path( item[ "id" ] )
+        if not os.path.isfile( path ):
+            return synthetic_bytes( item[ "id" ], start, end )
+        with open( path, "rb" ) as stream:
+            stream.seek( start )
+            return stream.read( end - start )
+
+    def digest_data( self, item ):
+        digest = hashlib.sha256()
+        for offset in range( 0, item[ "size" ], k_chunk ):
+            digest.update( self.read_data( item, offset, min( offset + k_chunk, item[ "size" ] ) ) )
+        return digest.hexdigest()
+
+    def get_item( self, title, folder_id="" ):
+        for item_id in self.contents[ folder_id ]:
+            if self.items[ item_id ][ "title" ] == title:
+                return self.items[ item_id ]
+        return None
+
+    def remove_item( self, item_id ):
+        item = self.items.pop( item_id )
+        self.contents[ item[ "ownerFolder" ] or "" ].pop( item_id, None )
+        if os.path.isfile( self.data_path( item_id ) ):
+            os.remove( self.data_path( item_id ) )
+        return item
+
+    def start( self, port=0 ):
+        portal = self
+        class Handler( MockHandler ):
+            pass
+        Handler.portal = portal
+        self.server = MockServer( ( "127.0.0.1", port ), Handler )
+        self.url = "http://127.0.0.1:" + str( self.server.server_address[1] )
+        thread = threading.Thread( target=self.server.serve_forever )
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+    def stop( self ):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree( self.data_dir, ignore_errors=True )
+
+    def reset_stats( self ):
+        with self.lock:
+            self.counts = collections.Counter()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def get_stats( self ):
+        with self.lock:
+            stats = { }
+            stats[ "requests" ] = sum( self.counts.values() )
+            stats[ "endpoints" ] = dict( self.counts )
+            stats[ "bytesIn" ] = self.bytes_in
+            stats[ "bytesOut" ] = self.bytes_out
+            return stats
+
+class MockServer( ThreadingMixIn, HTTPServer ):
+    daemon_threads = True
+    request_queue_size = 128
+
+class MockHandler( BaseHTTPRequestHandler ):
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    portal = None
+
+    def log_message( self, format, *args ):
+        pass
+
+    def do_GET( self ):
+        self.handle_request( "GET" )
+
+    def do_POST( self ):
+        self.handle_request( "POST" )
+
+    def read_params( self ):
+        url = urlparse( self.path )
+        params = { }
+        for key, values in parse_qs( url.query, keep_blank_values=True ).items():
+            params[ key ] = values[0]
+        files = { }
+        length = int( self.headers.get( "Content-Length", 0 ) )
+        body = self.rfile.read( length ) if length > 0 else b""
+        content_type = self.headers.get( "Content-Type", "" )
+        if content_type.startswith( "multipart/form-data" ):
+            fields, files = parse_multipart( body, content_type )
+            params.update( fields )
+        elif len( body ) > 0:
+            for key, values in parse_qs( body.decode( "utf-8" ), keep_blank_values=True ).items():
+                params[ key ] = values[0]
+        return url.path, params, files, length
+
+    def send_json( self, obj, status=200 ):
+        body = json.dumps( obj ).encode( "utf-8" )
+        self.send_response( status )
+        self.send_header( "Content-Type", "application/json; charset=utf-8" )
+        self.send_header( "Content-Length", str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+        return len( body )
+
+    def send_error_json( self, code, message ):
+        error = { }
+        error[ "code" ] = code
+        error[ "message" ] = message
+        error[ "details" ] = [ ]
+        return self.send_json( { "error": error } )
+
+    def handle_request( self, method ):
+        portal = self.portal
+        path, params, files, size_in = self.read_params()
+        if portal.latency > 0:
+            time.sleep( portal.latency )
+        endpoint = re.sub( r"/[0-9a-f]{32}", "/{id}", path )
+        endpoint = re.sub( r"/content/users/[^/]+", "/content/users/{user}", endpoint )
+        try:
+            size_out = self.dispatch( method, path, params, files )
+        except Exception as e:
+            size_out = self.send_error_json( 500, str( e ) )
+        with portal.lock:
+            portal.counts[ method + " " + endpoint ] += 1
+            portal.bytes_in += size_in
+            portal.bytes_out += size_out
+
+    def dispatch( self, method, path, params, files ):
+        portal = self.portal
+        m = re.match( r"^/rest/services/([^/]+)/FeatureServer/0(/query)?$", path )
+        if m is not None and m.groups()[0] in portal.services:
+            service = portal.services[ m.groups()[0] ]
+            if m.groups()[1] is None:
+                return self.send_json( layer_info( service ) )
+            return self.query( service, params )
+        m = re.match( r"^/sharing/rest(/.*)$", path )
+        if m is None:
+            return self.send_error_json( 404, "Not found." )
+        path = m.groups()[0]
+        if path == "/info":
+            auth_info = { }
+            auth_info[ "isTokenBasedSecurity" ] = True
+            auth_info[ "tokenServicesUrl" ] = portal.url + "/sharing/rest/generateToken"
+            return self.send_json( { "authInfo": auth_info } )
+        if path == "/generateToken":
+            token = uuid.uuid4().hex
+            expires = int( ( time.time() + int( params.get( "expiration", 60 ) ) * 60 ) * 1000 )
+            with portal.lock:
+                portal.tokens[ token ] = expires
+            return self.send_json( { "token": token, "expires": expires, "ssl": False } )
+        if portal.tokens.get( params.get( "token" ), 0 ) < time.time() * 1000:
+            return self.send_error_json( 498, "Invalid token." )
+        with portal.lock:
+            if path == "/search":
+                return self.search( params )
+            if path == "/community/self":
+                return self.send_json( { "username": k_username, "groups": [ ] } )
+            m = re.match( r"^/content/items/([0-9a-f]+)(/data)?$", path )
+            if m is not None:
+                item = portal.items.get( m.groups()[0] )
+                if item is None:
+                    return self.send_error_json( 400, "Item does not exist or is inaccessible." )
+                if m.groups()[1] is None:
+                    return self.send_json( self.item_info( item ) )
+            else:
+                return self.user_content( path, params, files )
+        return self.send_data( item )
+
+    def item_info( self, item ):
+        if "service" not in item:
+            return item
+        item = dict( item )
+        item[ "url" ] = self.portal.url + "/rest/services/" + item.pop( "service" ) + "/FeatureServer"
+        return item
+
+    def query( self, service, params ):
+        oids = service[ "oids" ]
+        low = 0
+        high = len( oids )
+        for op, value in re.findall( r"OBJECTID ([<>]=?) ([0-9]+)", params.get( "where", "" ) ):
+            if op == ">=":
+                low = max( low, bisect.bisect_left( oids, int( value ) ) )
+            elif op == "<":
+                high = min( high, bisect.bisect_left( oids, int( value ) ) )
+        high = max( high, low )
+        if "outStatistics" in params:
+            attributes = { "min_oid": oids[ low ] if high > low else None, "max_oid": oids[ high - 1 ] if high > low else None }
+            return self.send_json( { "features": [ { "attributes": attributes } ] } )
+        if params.get( "returnCountOnly" ) == "true":
+            return self.send_json( { "count": high - low } )
+        start = low + int( params.get( "resultOffset", 0 ) )
+        count = min( int( params.get( "resultRecordCount", service[ "maxRecordCount" ] ) ), service[ "maxRecordCount" ] )
+        end = min( start + count, high )
+        features = [ feature( oid ) for oid in oids[ start : end ] ]
+        result = { "type": "FeatureCollection", "features": features }
+        if end < high and "resultRecordCount" not in params:
+            result[ "properties" ] = { "exceededTransferLimit": True }
+        return self.send_json( result )
+
+    def send_data( self, item ):
+        portal = self.portal
+        size = item[ "size" ]
+        start = 0
+        end = size
+        status = 200
+        etag = "\"" + item[ "id" ] + "-" + str( item[ "modified" ] ) + "\""
+        m = re.match( r"^bytes=([0-9]+)-([0-9]*)$", self.headers.get( "Range", "" ) )
+        if m is not None and self.headers.get( "If-Range", etag ) == etag:
+            start = int( m.groups()[0] )
+            if m.groups()[1] != "":
+                end = min( int( m.groups()[1] ) + 1, size )
+            if start >= size:
+                self.send_response( 416 )
+                self.send_header( "Content-Range", "bytes */" + str( size ) )
+                self.send_header( "Content-Length", "0" )
+                self.end_headers()
+                return 0
+            status = 206
+        self.send_response( status )
+        self.send_header( "Content-Type", "application/octet-stream" )
+        self.send_header( "Content-Length", str( end - start ) )
+        self.send_header( "ETag", etag )
+        if status == 206:
+            self.send_header( "Content-Range", "bytes " + str( start ) + "-" + str( end - 1 ) + "/" + str( size ) )
+        self.end_headers()
+        limit = end
+        if portal.truncate_data > 0:
+            limit = min( start + portal.truncate_data, end )
+            portal.truncate_data = 0
+        for offset in range( start, limit, k_chunk ):
+            self.wfile.write( portal.read_data( item, offset, min( offset + k_chunk, limit ) ) )
+        if limit < end:
+            self.close_connection = True
+        return limit - start
+
+    def search( self, params ):
+        portal = self.portal
+        terms = [ term for term in re.split( r"\s+AND\s+", params.get( "q", "" ) ) if term != "" ]
+        results = [ ]
+        for item in portal.items.values():
+            matched = True
+            for term in terms:
+                modified = re.match( r"^modified:\[([0-9]+) TO ([0-9]+)\]$", term )
+                if term.startswith( "owner:" ):
+                    matched = matched and item[ "owner" ] == term[6:]
+                elif modified is not None:
+                    matched = matched and int( modified.groups()[0] ) <= item[ "modified" ] <= int( modified.groups()[1] )
+                elif not term.startswith( ( "type:", "tags:" ) ):
+                    matched = matched and term.lower() in item[ "title" ].lower()
+            if matched:
+                results.append( item )
+        return self.send_json( self.page( results, params, "results" ) )
+
+    def page( self, items, params, key ):
+        start = int( params.get( "start", 1 ) )
+        num = min( int( params.get( "num", 10 ) ), self.portal.page_size )
+        page = items[ start - 1 : start - 1 + num ]
+        content = { }
+        content[ "total" ] = len( items )
+        content[ "start" ] = start
+        content[ "num" ] = num
+        content[ "nextStart" ] = start + len( page ) if start - 1 + num < len( items ) else -1
+        content[ key ] = page
+        return content
+
+    def user_content( self, path, params, files ):
+        portal = self.portal
+        m = re.match( r"^/content/users/([^/]+)(?:/([0-9a-f]{32}))?(?:/(.*))?$", path )
+        if m is None:
+            return self.send_error_json( 404, "Not found." )
+        username, folder_id, action = m.groups()
+        folder_id = folder_id or ""
+        action = action or ""
+        if folder_id != "" and folder_id not in portal.folders:
+            return self.send_error_json( 400, "Folder does not exist." )
+        if action == "":
+            items = [ portal.items[ item_id ] for item_id in portal.contents[ folder_id ] ]
+            content = self.page( items, params, "items" )
+            content[ "username" ] = username
+            content[ "currentFolder" ] = portal.folders.get( folder_id )
+            if folder_id == "":
+                content[ "folders" ] = list( portal.folders.values() )
+            return self.send_json( content )
+        if action == "createFolder":
+            folder = portal.add_folder( params.get( "title", "" ) )
+            return self.send_json( { "success": True, "folder": folder } )
+        if action == "delete" and folder_id != "":
+            for item_id in list( portal.contents[ folder_id ] ):
+                portal.remove_item( item_id )
+            folder = portal.folders.pop( folder_id )
+            portal.contents.pop( folder_id )
+            return self.send_json( { "success": True, "folder": folder } )
+        if action == "addItem":
+            item = portal.add_item( folder_id, params.get( "title", "" ), 0, params )
+            if "file" in files:
+                item[ "name" ] = files[ "file" ][0]
+                portal.set_data( item, files[ "file" ][1] )
+            elif "text" in params:
+                item[ "name" ] = None
+                portal.set_data( item, params[ "text" ].encode( "utf-8" ) )
+            elif params.get( "multipart" ) == "true":
+                item[ "name" ] = params.get( "filename", item[ "name" ] )
+                portal.parts[ item[ "id" ] ] = { }
+            return self.send_json( { "success": True, "id": item[ "id" ], "folder": folder_id } )
+        if action in [ "shareItems", "unshareItems" ]:
+            results = [ ]
+            for item_id in params.get( "items", "" ).split( "," ):
+                status = { }
+                status[ "itemId" ] = item_id
+                status[ "success" ] = item_id in portal.items
+                if status[ "success" ] and action == "shareItems":
+                    item = portal.items[ item_id ]
+                    if params.get( "everyone" ) == "true":
+                        item[ "access" ] = "public"
+                    elif params.get( "org" ) == "true" and item[ "access" ] != "public":
+                        item[ "access" ] = "org"
+                    elif params.get( "org" ) == "true":
+                        pass
+                    elif params.get( "groups", "" ) != "" and item[ "access" ] == "private":
+                        item[ "access" ] = "shared"
+                    elif params.get( "everyone" ) == "false" and params.get( "org" ) == "false":
+                        item[ "access" ] = "private"
+                    elif params.get( "everyone" ) == "false" and item[ "access" ] == "public":
+                        item[ "access" ] = "org"
+                status[ "notSharedWith" if action == "shareItems" else "notUnsharedFrom" ] = [ ]
+                results.append( status )
+            return self.send_json( { "results": results } )
+        if action in [ "deleteItems", "moveItems" ]:
+            results = [ ]
+            target = params.get( "folder", "/" )
+            target = "" if target == "/" else target
+            for item_id in params.get( "items", "" ).split( "," ):
+                status = { }
+                status[ "itemId" ] = item_id
+                status[ "success" ] = item_id in portal.items
+                if not status[ "success" ]:
+                    status[ "error" ] = { "code": 400, "message": "Item does not exist or is inaccessible." }
+                elif action == "deleteItems":
+                    portal.remove_item( item_id )
+                else:
+                    item = portal.items[ item_id ]
+                    portal.contents[ item[ "ownerFolder" ] or "" ].pop( item_id, None )
+                    portal.contents[ target ][ item_id ] = True
+                    item[ "ownerFolder" ] = target if target != "" else None
+                results.append( status )
+            return self.send_json( { "results": results } )
+        m = re.match( r"^items/([0-9a-f]{32})/(delete|update|addPart|commit|status)$", action )
+        if m is None or m.groups()[0] not in portal.items:
+            return self.send_error_json( 400, "Item does not exist or is inaccessible." )
+        item_id, verb = m.groups()
+        item = portal.items[ item_id ]
+        if verb == "delete":
+            portal.remove_item( item_id )
+            return self.send_json( { "success": True, "itemId": item_id } )
+        if verb == "update":
+            for key in params:
+                if key not in [ "f", "token", "multipart", "filename" ]:
+                    item[ key ] = params[ key ]
+            item[ "modified" ] = int( time.time() * 1000 )
+            if "file" in files:
+                portal.set_data( item, files[ "file" ][1] )
+            elif params.get( "multipart" ) == "true":
+                portal.parts[ item_id ] = { }
+            return self.send_json( { "success": True, "id": item_id } )
+        if verb == "addPart":
+            part_path = portal.data_path( item_id ) + ".part" + params.get( "partNum", "1" )
+            with open( part_path, "wb" ) as out:
+                out.write( files.get( "file", ( "", b"" ) )[1] )
+            portal.parts.setdefault( item_id, { } )[ int( params.get( "partNum", 1 ) ) ] = part_path
+            return self.send_json( { "success": True, "id": item_id } )
+        if verb == "commit":
+            parts = portal.parts.pop( item_id, { } )
+            with open( portal.data_path( item_id ), "wb" ) as out:
+                for part_num in sorted( parts ):
+                    with open( parts[ part_num ], "rb" ) as part:
+                        shutil.copyfileobj( part, out )
+                    os.remove( parts[ part_num ] )
+            item[ "size" ] = os.path.getsize( portal.data_path( item_id ) )
+            item[ "modified" ] = int( time.time() * 1000 )
+            portal.processing[ item_id ] = portal.processing_polls
+            return self.send_json( { "success": True, "id": item_id } )
+        if portal.processing.get( item_id, 0 ) > 0:
+            portal.processing[ item_id ] -= 1
+            return self.send_json( { "status": "processing", "itemId": item_id } )
+        return self.send_json( { "status": "completed", "itemId": item_id } )
+
+def layer_info( service ):
+    info = { }
+    info[ "id" ] = 0
+    info[ "name" ] = "features"
+    info[ "type" ] = "Feature Layer"
+    info[ "objectIdField" ] = "OBJECTID"
+    info[ "maxRecordCount" ] = service[ "maxRecordCount" ]
+    info[ "supportsStatistics" ] = True
+    info[ "fields" ] = [ { "name": "OBJECTID", "type": "esriFieldTypeOID" }, { "name": "name", "type": "esriFieldTypeString" } ]
+    return info
+
+def feature( oid ):
+    result = { }
+    result[ "type" ] = "Feature"
+    result[ "id" ] = oid
+    result[ "geometry" ] = { "type": "Point", "coordinates": [ ( oid % 360 ) - 180.0, ( oid % 170 ) - 85.0 ] }
+    result[ "properties" ] = { "OBJECTID": oid, "name": "feature" + str( oid ) }
+    return result
+
+k_wrapper = """
+import os, sys, atexit, runpy
+def write_peak_rss():
+    peak = 0
+    try:
+        with open( "/proc/self/status" ) as status:
+            for line in status:
+                if line.startswith( "VmHWM:" ):
+                    peak = int( line.split()[1] ) * 1024
+    except IOError:
+        import resource
+        peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+        peak = peak if sys.platform == "darwin" else peak * 1024
+    with open( os.environ[ "AGBENCH_RSS" ], "w" ) as out:
+        out.write( str( peak ) )
+atexit.register( write_peak_rss )
+sys.argv = sys.argv[1:]
+sys.path[0] = os.path.dirname( os.path.abspath( sys.argv[0] ) )
+runpy.run_path( sys.argv[0], run_name="__main__" )
+"""
+
+def run_agtool( argv, home, stdin=None ):
+    rss_path = os.path.join( home, "rss.txt" )
+    env = dict( os.environ )
+    env[ "HOME" ] = home
+    env[ "USERPROFILE" ] = home
+    env[ "AGBENCH_RSS" ] = rss_path
+    agtool_path = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "agtool.py" )
+    command = [ sys.executable, "-c", k_wrapper, agtool_path ] + argv
+    start = time.time()
+    process = subprocess.Popen( command, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+    stdout, stderr = process.communicate( stdin.encode( "utf-8" ) if stdin is not None else b"" )
+    result = { }
+    result[ "elapsed" ] = time.time() - start
+    result[ "peakRss" ] = 0
+    if os.path.isfile( rss_path ):
+        with open( rss_path, "r" ) as rss:
+            result[ "peakRss" ] = int( rss.read() )
+        os.remove( rss_path )
+    result[ "stdout" ] = stdout
+    result[ "stderr" ] = stderr
+    result[ "returncode" ] = process.returncode
+    return result
+
+def make_file( path, size ):
+    block = hashlib.sha256( b"agbench" ).digest() * ( k_chunk // 32 )
+    with open( path, "wb" ) as out:
+        remaining = size
+        while remaining > 0:
+            out.write( block[ : min( remaining, len( block ) ) ] )
+            remaining -= len( block )
+
+def file_digest( path ):
+    digest = hashlib.sha256()
+    with open( path, "rb" ) as stream:
+        while True:
+            chunk = stream.read( k_chunk )
+            if len( chunk ) == 0:
+                return digest.hexdigest()
+            digest.update( chunk )
+
+def count_features( path ):
+    with open( path, "r" ) as stream:
+        return len( json.load( stream ).get( "features", [ ] ) )
+
+def benchmark( portal, home, name, argv, stdin=None, transfer=0, check=None ):
+    portal.reset_stats()
+    result = run_agtool( argv + [ "--portal", portal.url ], home, stdin )
+    stats = portal.get_stats()
+    row = { }
+    row[ "name" ] = name
+    row[ "command" ] = " ".join( argv )
+    row[ "requests" ] = stats[ "requests" ]
+    row[ "endpoints" ] = stats[ "endpoints" ]
+    row[ "wall" ] = round( result[ "elapsed" ], 3 )
+    row[ "peakRss" ] = result[ "peakRss" ]
+    row[ "bytesIn" ] = stats[ "bytesIn" ]
+    row[ "bytesOut" ] = stats[ "bytesOut" ]
+    row[ "throughput" ] = round( transfer / max( result[ "elapsed" ], 0.001 ), 1 ) if transfer > 0 else 0
+    row[ "ok" ] = result[ "returncode" ] == 0 and b"\"error\"" not in result[ "stdout" ]
+    if row[ "ok" ] and check is not None:
+        row[ "check" ] = check( result )
+        row[ "ok" ] = row[ "check" ] == ""
+    if not row[ "ok" ]:
+        row[ "output" ] = ( row.get( "check", "" ) + "\n" + ( result[ "stdout" ] + result[ "stderr" ] ).decode( "utf-8", "replace" ) )[ -2000 : ]
+    return row
+
+def run_benchmarks( options ):
+    items = int( options.get( "items", 10000 ) )
+    resolve = int( options.get( "resolve", 200 ) )
+    delete = int( options.get( "delete", 1000 ) )
+    transfer = int( float( options.get( "transfer-mb", 256 ) ) * 1048576 )
+    only = options.get( "only", "" ).split( "," ) if "only" in options else None
+    portal = MockPortal( items, int( options.get( "folders", 10 ) ), int( options.get( "folder-items", 100 ) ), int( options.get( "item-size", 1024 ) ), int( options.get( "page-size", 100 ) ), float( options.get( "latency", 0 ) ) )
+    home = tempfile.mkdtemp( prefix="agbench-home-" )
+    rows = [ ]
+    try:
+        portal.start()
+        login = run_agtool( [ "login", "--portal", portal.url, "--username", k_username, "--password", "bench", "--save" ], home )
+        if login[ "returncode" ] != 0:
+            raise RuntimeError( login[ "stderr" ].decode( "utf-8", "replace" ) )
+        bulk = portal.add_folder( "bulk" )
+        for i in range( delete ):
+            portal.add_item( bulk[ "id" ], "bulk" + str( i ) )
+        features = int( options.get( "features", 100000 ) )
+        portal.add_feature_service( "", "layer", features )
+        upload_path = os.path.join( home, "upload.bin" )
+        download_path = os.path.join( home, "download.bin" )
+        export_path = os.path.join( home, "layer.geojson" )
+        def expect( name, actual, expected ):
+            return "" if actual == expected else name + ": expected " + str( expected ) + ", got " + str( actual )
+        def check_ls( result ):
+            lines = [ line for line in result[ "stdout" ].decode( "utf-8" ).splitlines() if line != "" ]
+            return expect( "entries", len( lines ), len( portal.folders ) + len( portal.contents[ "" ] ) )
+        def check_resolve( result ):
+            records = [ json.loads( line ) for line in result[ "stderr" ].decode( "utf-8" ).splitlines() if line.startswith( "{" ) ]
+            return expect( "resolved", len( [ record for record in records if record.get( "status" ) == "ok" ] ), resolve )
+        def check_delete( result ):
+            return expect( "remaining", len( portal.contents[ bulk[ "id" ] ] ), 0 )
+        def check_upload( result ):
+            item = portal.get_item( "upload.bin" )
+            return expect( "digest", portal.digest_data( item ) if item is not None else "", file_digest( upload_path ) )
+        def check_download( result ):
+            return expect( "digest", file_digest( download_path ) if os.path.isfile( download_path ) else "", file_digest( upload_path ) )
+        def check_export( result ):
+            return expect( "features", count_features( export_path ), features )
+        cases = [ ]
+        cases.append( ( "ls", [ "ls" ], None, 0, check_ls ) )
+        cases.append( ( "ls-recursive", [ "ls", "-R" ], None, 0, None ) )
+        lines = "".join( "info folder" + str( i % 10 ) + "/item" + str( i % 100 ) + "\n" for i in range( resolve ) )
+        cases.append( ( "resolve", [ "batch", "-", "--no-cache" ], lines, 0, check_resolve ) )
+        cases.append( ( "resolve-cached", [ "batch", "-" ], lines, 0, check_resolve ) )
+        cases.append( ( "delete", [ "rm", "bulk/*" ], None, 0, check_delete ) )
+        if only is None or "upload" in only or "download" in only:
+            make_file( upload_path, transfer )
+        cases.append( ( "upload", [ "update", "upload.bin", "--file", upload_path ], None, transfer, check_upload ) )
+        cases.append( ( "download", [ "cat", "upload.bin", "--out", download_path ], None, transfer, check_download ) )
+        cases.append( ( "export", [ "export", "layer", "--out", export_path ], None, 0, check_export ) )
+        for name, argv, stdin, size, check in cases:
+            if only is not None and name not in only:
+                continue
+            rows.append( benchmark( portal, home, name, argv, stdin, size, check ) )
+    finally:
+        portal.stop()
+        shutil.rmtree( home, ignore_errors=True )
+    return rows
+
+def format_rows( rows ):
+    lines = [ ]
+    lines.append( "benchmark".ljust( 16 ) + "requests".rjust( 10 ) + "wall s".rjust( 10 ) + "peak MB".rjust( 10 ) + "MB/s".rjust( 10 ) + "  status" )
+    for row in rows:
+        line = row[ "name" ].ljust( 16 )
+        line = line + str( row[ "requests" ] ).rjust( 10 )
+        line = line + ( "%.3f" % row[ "wall" ] ).rjust( 10 )
+        line = line + ( "%.1f" % ( row[ "peakRss" ] / 1048576.0 ) ).rjust( 10 )
+        line = line + ( "%.1f" % ( row[ "throughput" ] / 1048576.0 ) if row[ "throughput" ] > 0 else "-" ).rjust( 10 )
+        line = line + "  " + ( "ok" if row[ "ok" ] else "FAILED" )
+        lines.append( line )
+    return "\n".join( lines ) + "\n"
+
+def main():
+    parameters, options = get_options( sys.argv[1:] )
+    command = parameters[0] if len( parameters ) > 0 else ""
+    if command == "serve":
+        portal = MockPortal( int( options.get( "items", 10000 ) ), int( options.get( "folders", 10 ) ), int( options.get( "folder-items", 100 ) ), int( options.get( "item-size", 1024 ) ), int( options.get( "page-size", 100 ) ), float( options.get( "latency", 0 ) ) )
+        portal.add_feature_service( "", "layer", int( options.get( "features", 100000 ) ) )
+        sys.stdout.write( portal.start( int( options.get( "port", 0 ) ) ) + "\n" )
+        sys.stdout.flush()
+        try:
+            while True:
+                time.sleep( 3600 )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            portal.stop()
+        return
+    if command != "run":
+        sys.stdout.write( k_usage )
+        return
+    rows = run_benchmarks( options )
+    if "json" in options:
+        sys.stdout.write( json.dumps( rows, indent=4, sort_keys=True ) + "\n" )
+    else:
+        sys.stdout.write( format_rows( rows ) )
+        for row in rows:
+            if not row[ "ok" ]:
+                sys.stdout.write( "\n" + row[ "name" ] + ":\n" + row[ "output" ] + "\n" )
+    if len( [ row for row in rows if not row[ "ok" ] ] ) > 0:
+        sys.exit( 1 )
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,41 @@
 #!/usr/bin/python
 
-import os, sys, requests, json, getpass, time, math, re
+import os, sys, json, getpass, time, math, re, errno, collections, threading, shlex, fnmatch, hashlib, socket, csv, heapq, atexit
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 settings_path = os.path.expanduser( "~/.config/Esri/agtool/agtool.json" )
-settings = { }
+settings = None
+settings_changes = { }
+settings_lock = threading.RLock()
+settings_removed = object()
+
+cache_path = os.path.expanduser( "~/.config/Esri/agtool/agtool_cache.json" )
+cache = None
+cache_changes = [ ]
+cache_lock = threading.RLock()
+
+index_path = os.path.expanduser( "~/.config/Esri/agtool/agtool_index.sqlite" )
+
+data_cache_path = os.path.expanduser( "~/.config/Esri/agtool/data" )
 
 portalUrl = "https://www.arcgis.com"
 
@@ -11,8 +43,163 @@ k_default_username = "default_username"
 k_password = "password"
 k_token = "token"
 k_expires = "expires"
+k_timeout = "timeout"
+k_retries = "retries"
+k_pool_size = "pool_size"
+k_cache_ttl = "cache_ttl"
+k_cache_size = "cache_size"
+k_jobs = "jobs"
+k_chunk_size = "chunk_size"
+k_multipart_threshold = "multipart_threshold"
+k_segments = "segments"
+k_batch_size = "batch_size"
+k_expiration = "expiration"
+k_profiles = "profiles"
+k_concurrency = "concurrency"
+k_host_concurrency = "host_concurrency"
+k_data_cache_size = "data_cache_size"
+
+k_retry_status = ( 429, 500, 502, 503, 504 )
+k_post_retry_status = ( 429, 503 )
+k_token_error_codes = ( 498, 499 )
+
+k_auth_info_ttl = 86400
+k_refresh_margin = 300
+
+k_sync_manifest = ".agtool-sync.json"
+k_sync_parts = ".agtool-sync.parts"
+
+k_index_overlap = 600000
+k_index_sort_fields = [ "title", "name", "type", "size", "access", "owner", "modified" ]
+
+k_formats = [ "json", "jsonl", "csv", "tsv" ]
+k_export_formats = [ "jsonl", "geojson" ]
+k_manifest_columns = [ "path", "id", "file", "thumbnail" ]
+k_item_fields = [ "id", "title", "name", "type", "owner", "access", "size", "modified", "ownerFolder", "tags" ]
+
+k_page_size = 100
+k_max_parts = 10000
+k_download_chunk = 65536
+k_min_segment = 8388608
+k_pipe_depth = 64
+
+k_copy_fields = [
+    "type",
+    "tags",
+    "typeKeywords",
+    "snippet",
+    "description",
+    "accessInformation",
+    "licenseInfo",
+    "url",
+    "culture"
+    ]
+
+k_usage = """usage: agtool <command> [ <path> ... ] [ --option value ... ]
+
+commands:
+    login               Log in and cache a token
+    logout              Forget the cached token and password
+    ls [ folder ]       List a folder ( -R lists every folder )
+    cat item            Write item data to stdout or --out
+    info item ...       Show item details ( --async fetches many with asyncio )
+    export item         Write a feature layer's features ( --layer n, --where, --export-format jsonl|geojson,
+                        --out resumes from path.checkpoint )
+    mkdir folder        Create a folder
+    rmdir folder        Delete a folder
+    rm item ...         Delete items ( titles may be glob patterns )
+    mv item ... folder  Move items to a folder
+    cp item ... dest    Copy items to a folder, or one item to a new path
+    share item ...      Share items ( --everyone, --org, --groups id,title,... )
+    unshare item ...    Stop sharing items ( --everyone, --org, --groups )
+    du                  Total item sizes per folder, type and access ( --top n lists the largest )
+    find [ query ]      Search items ( --type, --tags, --owner, --modified-after,
+                        --modified-before, --limit )
+    update item         Add or update an item ( --file, --thumbnail, fields )
+    update --from file  Update items listed in a CSV or JSON lines manifest ( --log resumes,
+                        --async updates with asyncio )
+    sync dir folder     Upload changed files ( --pull downloads, --delete, --dry-run )
+    index               Refresh the local content index ( --full rebuilds, --info keeps item details )
+    cache stats         Show the cat data cache ( cache prune [ --max-size MB ], cache clear )
+    batch file          Run one command per line from a file or -
+
+options:
+    --portal url        Portal to use ( default https://www.arcgis.com )
+    --profile name      Saved portal and username ( login --profile name --portal url saves one )
+    --format type       Write ls, info, find and bulk results as json, jsonl, csv or tsv
+    --offline           Answer ls, info and find from the local index
+    --concurrency n     Requests in flight with --async ( default 32, --host-concurrency 16 )
+    --trace             Print a per-endpoint request summary to stderr
+    --trace-file path   Append one record per request ( --trace-format jsonl or chrome )
+"""
+
+class LocalDict( MutableMapping ):
+
+    def __init__( self ):
+        self.shared = { }
+        self.local = threading.local()
+
+    def get_dict( self ):
+        return getattr( self.local, "value", self.shared )
+
+    def set_dict( self, value ):
+        if self.is_bound():
+            self.local.value = value
+        else:
+            self.shared = value
+
+    def bind( self, value ):
+        self.local.value = value
+
+    def is_bound( self ):
+        return hasattr( self.local, "value" )
+
+    def __getitem__( self, key ):
+        return self.get_dict()[ key ]
+
+    def __setitem__( self, key, value ):
+        self.get_dict()[ key ] = value
+
+    def __delitem__( self, key ):
+        del self.get_dict()[ key ]
+
+    def __iter__( self ):
+        return iter( self.get_dict() )
+
+    def __len__( self ):
+        return len( self.get_dict() )
+
+class LocalOutput:
+
+    def __init__( self, stream ):
+        self.stream = stream
+        self.local = threading.local()
+
+    def get_stream( self ):
+        return getattr( self.local, "stream", self.stream )
 
-args = { }
+    def bind( self, stream ):
+        self.local.stream = stream
+
+    def write( self, text ):
+        return self.get_stream().write( text )
+
+    def flush( self ):
+        self.get_stream().flush()
+
+    def __getattr__( self, name ):
+        return getattr( self.get_stream(), name )
+
+args = LocalDict()
+command_result = LocalDict()
+
+clients = { }
+
+trace_local = threading.local()
+trace_lock = threading.Lock()
+trace_records = None
+trace_pool_classes = None
+retry_class = None
 
 def load_json_file( path ):
     if not os.path.isfile( path ):
@@ -22,151 +209,344 @@ def load_json_file( path ):
 
 def save_json_file( path, obj ):
     dirname = os.path.dirname( path )
-    if not os.path.exists( dirname ):
+    if dirname != "" and not os.path.exists( dirname ):
         os.makedirs( dirname )
-    with open( path, "w" ) as data_file:
+    temp_path = path + "." + str( os.getpid() ) + ".tmp"
+    with open( temp_path, "w" ) as data_file:
         json.dump( obj, data_file, indent=4, sort_keys=True )
+    replace_file( temp_path, path )
+
+def lock_file( stream ):
+    if fcntl is not None:
+        fcntl.flock( stream.fileno(), fcntl.LOCK_EX )
+    elif msvcrt is not None:
+        stream.seek( 0 )
+        msvcrt.locking( stream.fileno(), msvcrt.LK_LOCK, 1 )
+
+def unlock_file( stream ):
+    if fcntl is not None:
+        fcntl.flock( stream.fileno(), fcntl.LOCK_UN )
+    elif msvcrt is not None:
+        stream.seek( 0 )
+        msvcrt.locking( stream.fileno(), msvcrt.LK_UNLCK, 1 )
 
 def load_settings():
     global settings
-    settings = load_json_file( settings_path )
+    with settings_lock:
+        settings = load_json_file( settings_path )
 
 def save_settings():
-    save_json_file( settings_path, settings )
+    global settings, settings_changes
+    with settings_lock:
+        if len( settings_changes ) == 0:
+            return
+        dirname = os.path.dirname( settings_path )
+        if dirname != "" and not os.path.exists( dirname ):
+            os.makedirs( dirname )
+        with open( settings_path + ".lock", "a+" ) as lock:
+            lock_file( lock )
+            try:
+                disk_settings = load_json_file( settings_path )
+                for key in settings_changes:
+                    if settings_changes[ key ] is settings_removed:
+                        disk_settings.pop( key, None )
+                    else:
+                        disk_settings[ key ] = settings_changes[ key ]
+                save_json_file( settings_path, disk_settings )
+            finally:
+                unlock_file( lock )
+        settings = disk_settings
+        settings_changes = { }
 
 def get_settings( key, defaultValue="" ):
-    return settings[ key ] if key in settings else defaultValue
+    with settings_lock:
+        if settings is None:
+            load_settings()
+        return settings[ key ] if key in settings else defaultValue
 
 def set_settings( key, value ):
-    global settings
-    if get_settings( key ) == value:
-        return
-    settings[ key ] = value
-    save_settings()
+    with settings_lock:
+        if get_settings( key, None ) == value:
+            return
+        settings[ key ] = value
+        settings_changes[ key ] = value
 
 def remove_settings( key ):
-    global settings
-    if not key in settings:
-        return
-    settings.pop( key )
-    save_settings()
+    with settings_lock:
+        if get_settings( key, None ) is None:
+            return
+        settings.pop( key )
+        settings_changes[ key ] = settings_removed
+
+def normalize_portal_url( url ):
+    if re.match( r"^https?://", url ) is None:
+        url = "https://" + url
+    return url.rstrip( "/" )
+
+def get_portal_key( portal ):
+    if portal == "" or portal == portalUrl:
+        return ""
+    return re.sub( r"^https?://", "", portal )
+
+def hash_portal_key( portal, key ):
+    portal_key = get_portal_key( portal )
+    return key if portal_key == "" else portal_key + "/" + key
 
-def get_default_username():
-    return get_settings( k_default_username )
+def get_default_username( portal="" ):
+    return get_settings( hash_portal_key( portal, k_default_username ) )
 
-def set_default_username( username ):
-    set_settings( k_default_username, username )
+def set_default_username( username, portal="" ):
+    set_settings( hash_portal_key( portal, k_default_username ), username )
 
-def hash_user_key( username, key):
+def hash_user_key( username, key, portal="" ):
     if username == "":
-        username = get_default_username()
-    return username + "_" + key
+        username = get_default_username( portal )
+    return hash_portal_key( portal, username + "_" + key )
 
-def get_user_settings( key, defaultValue="", username="" ):
-    return get_settings( hash_user_key( username, key ), defaultValue )
+def get_user_settings( key, defaultValue="", username="", portal="" ):
+    return get_settings( hash_user_key( username, key, portal ), defaultValue )
 
-def set_user_settings( key, value, username="" ):
-    set_settings( hash_user_key( username, key ), value )
+def set_user_settings( key, value, username="", portal="" ):
+    set_settings( hash_user_key( username, key, portal ), value )
 
-def remove_user_settings( key, username="" ):
-    remove_settings( hash_user_key( username, key ) )
+def remove_user_settings( key, username="", portal="" ):
+    remove_settings( hash_user_key( username, key, portal ) )
 
-def get_token():
-    token = get_user_settings( k_token )
-    if token == "":
-        return token
-    expires = get_expires()
-    if time.time() * 1000.0 >= expires:
-        return ""
-    return token
+def get_profile( name ):
+    return get_settings( k_profiles, { } ).get( name )
 
-def get_token_ex():
-    global args
-    username = get_default_username()
-    if "username" in args[ "options" ]:
-        username = args[ "options" ][ "username" ]
-        set_default_username( username )
-    token = get_token()
-    if token == "":
-        _login()
-        token = get_token()
-    return token
+def set_profile( name, profile ):
+    profiles = dict( get_settings( k_profiles, { } ) )
+    profiles[ name ] = profile
+    set_settings( k_profiles, profiles )
+
+def load_cache():
+    global cache
+    with cache_lock:
+        if cache is None:
+            cache = load_json_file( cache_path )
+    return cache
+
+def save_cache():
+    global cache, cache_changes
+    with cache_lock:
+        if len( cache_changes ) == 0:
+            return
+        dirname = os.path.dirname( cache_path )
+        if dirname != "" and not os.path.exists( dirname ):
+            os.makedirs( dirname )
+        with open( cache_path + ".lock", "a+" ) as lock:
+            lock_file( lock )
+            try:
+                disk_cache = load_json_file( cache_path )
+                for action, username, name, key, entry in cache_changes:
+                    entries = disk_cache.setdefault( username, { } ).setdefault( name, { } )
+                    if action == "set":
+                        entries[ key ] = entry
+                    elif action == "remove":
+                        entries.pop( key, None )
+                    else:
+                        for other in [ other for other in entries if other.startswith( key ) ]:
+                            entries.pop( other )
+                cache = disk_cache
+                trim_cache()
+                save_json_file( cache_path, cache )
+            finally:
+                unlock_file( lock )
+        cache_changes = [ ]
+
+def save_state():
+    save_settings()
+    save_cache()
+
+atexit.register( save_state )
 
-def set_token( token ):
-    set_user_settings( k_token, token )
+def get_user_cache( username, name ):
+    user_cache = load_cache().setdefault( username, { } )
+    return user_cache.setdefault( name, { } )
 
-def remove_token( ):
-    remove_user_settings( k_token )
+def get_cache_entry( username, name, key, ttl ):
+    with cache_lock:
+        entries = get_user_cache( username, name )
+        if key not in entries:
+            return None
+        entry = entries[ key ]
+        if time.time() - entry[ 1 ] >= ttl:
+            remove_cache_entry( username, name, key )
+            return None
+        return entry[ 0 ]
 
-def get_expires():
-    return get_user_settings( k_expires, 0 )
+def set_cache_entry( username, name, key, value ):
+    with cache_lock:
+        entries = get_user_cache( username, name )
+        entries[ key ] = [ value, time.time() ]
+        cache_changes.append( ( "set", username, name, key, entries[ key ] ) )
 
-def set_password( password ):
-    set_user_settings( k_password, password )
+def trim_cache():
+    size = int( get_settings( k_cache_size, 10000 ) )
+    with cache_lock:
+        for user_cache in load_cache().values():
+            for entries in user_cache.values():
+                if len( entries ) <= size:
+                    continue
+                oldest = sorted( entries, key=lambda k: entries[ k ][ 1 ] )
+                for k in oldest[ : len( entries ) - size ]:
+                    entries.pop( k )
 
-def remove_password( ):
-    remove_user_settings( k_password )
+def remove_cache_entry( username, name, key ):
+    with cache_lock:
+        entries = get_user_cache( username, name )
+        entries.pop( key, None )
+        cache_changes.append( ( "remove", username, name, key, None ) )
 
-def get_password():
-    return get_user_settings( k_password )
+def remove_cache_prefix( username, name, prefix ):
+    with cache_lock:
+        entries = get_user_cache( username, name )
+        for key in list( entries ):
+            if key.startswith( prefix ):
+                entries.pop( key )
+        cache_changes.append( ( "prefix", username, name, prefix, None ) )
 
-def set_expires( expires ):
-    set_user_settings( k_expires, expires )
+def item_cache_key( item_title, folder_id ):
+    return folder_id + "/" + item_title
 
-def remove_expires( ):
-    remove_user_settings( k_expires )
+k_skip_options = [
+    "username",
+    "password",
+    "save",
+    "forget",
+    "out",
+    "file",
+    "thumbnail",
+    "timeout",
+    "retries",
+    "pool-size",
+    "no-cache",
+    "cache-ttl",
+    "jobs",
+    "recursive",
+    "chunk-size",
+    "multipart-threshold",
+    "segments",
+    "log",
+    "stop-on-error",
+    "batch-size",
+    "help",
+    "pull",
+    "delete",
+    "dry-run",
+    "limit",
+    "modified-after",
+    "modified-before",
+    "sort-field",
+    "sort-order",
+    "expiration",
+    "portal",
+    "profile",
+    "trace",
+    "trace-file",
+    "trace-format",
+    "async",
+    "concurrency",
+    "host-concurrency",
+    "offline",
+    "full",
+    "info",
+    "format",
+    "from",
+    "everyone",
+    "org",
+    "groups",
+    "max-size",
+    "top",
+    "layer",
+    "where",
+    "export-format"
+    ]
+
+k_batch_options = [
+    "log",
+    "stop-on-error"
+    ]
 
 def skip_option( option ):
-    if option == "username":
-        return True
-    if option == "password":
-        return True
+    return option in k_skip_options
+
+def unary_option( option ):
     if option == "save":
         return True
     if option == "forget":
         return True
-    if option == "out":
+    if option == "no-cache":
         return True
-    if option == "file":
+    if option == "recursive":
         return True
-    if option == "thumbnail":
+    if option == "stop-on-error":
         return True
-    return False
-
-def unary_option( option ):
-    if option == "save":
+    if option == "help":
         return True
-    if option == "forget":
+    if option == "pull":
+        return True
+    if option == "delete":
+        return True
+    if option == "dry-run":
+        return True
+    if option == "trace":
+        return True
+    if option == "async":
+        return True
+    if option == "offline":
+        return True
+    if option == "full":
+        return True
+    if option == "info":
+        return True
+    if option == "everyone":
+        return True
+    if option == "org":
         return True
     return False
 
-def parse_args():
-    global args
-    args = { }
+def get_fields( options ):
+    fields = { }
+    for key in options:
+        if not skip_option( key ):
+            fields[ key ] = options[ key ]
+    return fields
+
+def parse_args( argv=None ):
+    if argv is None:
+        argv = sys.argv[1:]
+    args.set_dict( { } )
     args[ "parameters" ] = [ ]
     args[ "options" ] = { }
-    i = 1
-    while i < len(sys.argv):
-        arg = sys.argv[ i ]
+    i = 0
+    while i < len(argv):
+        arg = argv[ i ]
         i += 1
-        if arg.startswith("--"):
+        if arg == "-R":
+            args[ "options" ][ "recursive" ] = "true"
+        elif arg == "-h":
+            args[ "options" ][ "help" ] = "true"
+        elif arg.startswith("--"):
             key = arg[2:]
             if unary_option( key ):
                 args[ "options" ][key] = "true"
             else:
-                value = sys.argv[ i ]
+                if i >= len( argv ):
+                    raise ValueError( arg + ": Missing value." )
+                value = argv[ i ]
                 i += 1
                 args[ "options" ][key] = value
         else:
             args[ "parameters" ].append(arg)
-    if (len(args[ "parameters" ]) >= 2):
+    if len( args[ "parameters" ] ) >= 2 and args[ "parameters" ][0] != "find":
         regexp = r"^([^:]+)[:](.*)$"
         m = re.match( regexp, args[ "parameters" ][1] )
-        if m is not None:
+        if m is not None and re.match( r"^[A-Za-z]:[\\/]", args[ "parameters" ][1] ) is None:
             username = m.groups()[0]
             args[ "options" ][ "username" ] = username
             args[ "parameters" ][1] = m.groups()[1]
-            set_default_username( username )
 
 def get_user_input( prompt, defaultValue="" ):
     if defaultValue != "":
@@ -174,12 +554,97 @@ def get_user_input( prompt, defaultValue="" ):
     value = input( prompt ) if sys.version_info >= (3,0) else raw_input( prompt )
     return value if value != "" else defaultValue
 
+def record_error( error ):
+    if "error" not in command_result:
+        command_result[ "error" ] = error
+
 def print_error( msg ):
+    record_error( msg )
     sys.stdout.write( msg + "\n" )
 
+def get_format():
+    output_format = args.get( "options", { } ).get( "format", "" )
+    if output_format != "" and output_format not in k_formats:
+        raise AgtoolError( output_format + ": Unknown format." )
+    return output_format
+
+def format_value( value ):
+    if value is None:
+        return ""
+    if isinstance( value, list ) and all( not isinstance( v, ( dict, list ) ) for v in value ):
+        return ",".join( xstr( v ) if not isinstance( v, ( int, float ) ) else str( v ) for v in value )
+    if isinstance( value, ( dict, list ) ):
+        return json.dumps( value, separators=( ",", ":" ) )
+    return value
+
+class RecordWriter:
+
+    def __init__( self, output_format, stream, fields=None ):
+        self.format = output_format
+        self.stream = stream
+        self.fields = fields
+        self.writer = None
+        self.count = 0
+
+    def write( self, record ):
+        if self.format == "json":
+            self.stream.write( ( "[\n" if self.count == 0 else ",\n" ) + json.dumps( record, separators=( ",", ":" ) ) )
+        elif self.format == "jsonl":
+            self.stream.write( json.dumps( record, separators=( ",", ":" ) ) + "\n" )
+        else:
+            if self.writer is None:
+                if self.fields is None:
+                    self.fields = list( record )
+                self.writer = csv.writer( self.stream, delimiter="\t" if self.format == "tsv" else ",", lineterminator="\n" )
+                self.writer.writerow( self.fields )
+            self.writer.writerow( [ format_value( record.get( field ) ) for field in self.fields ] )
+        self.count += 1
+
+    def flush( self ):
+        self.stream.flush()
+
+    def close( self ):
+        if self.format == "json":
+            self.stream.write( ( "[" if self.count == 0 else "" ) + "\n]\n" )
+        self.stream.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+def new_writer( fields=None ):
+    stream = open( args[ "options" ][ "out" ], "w" ) if "out" in args[ "options" ] else sys.stdout
+    return RecordWriter( get_format(), stream, fields )
+
+def print_records( records, fields=None ):
+    writer = new_writer( fields )
+    try:
+        for record in records:
+            writer.write( record )
+    finally:
+        writer.close()
+
 def print_obj( obj ):
-    if "out" in args[ "options" ]:
-        with open( args[ "options"][ "out" ], "wb" ) as out:
+    if isinstance( obj, dict ):
+        if "error" in obj:
+            record_error( obj[ "error" ] )
+        elif obj.get( "success" ) == False:
+            record_error( obj )
+        command_result[ "result" ] = obj
+    output_format = get_format()
+    if output_format != "" and isinstance( obj, list ):
+        print_records( obj )
+    elif output_format != "" and isinstance( obj, dict ) and isinstance( obj.get( "results" ), list ):
+        print_records( obj[ "results" ] )
+    elif output_format in [ "json", "jsonl" ]:
+        text = json.dumps( obj, separators=( ",", ":" ) ) + "\n"
+        if "out" in args[ "options" ]:
+            with open( args[ "options" ][ "out" ], "w" ) as out:
+                out.write( text )
+        else:
+            sys.stdout.write( text )
+    elif output_format != "":
+        print_records( [ obj ] )
+    elif "out" in args[ "options" ]:
+        with open( args[ "options"][ "out" ], "w" ) as out:
             out.write( json.dumps( obj, indent=4, sort_keys=True ) + "\n" )
     else:
         sys.stdout.write( json.dumps( obj, indent=4, sort_keys=True ) + "\n" )
@@ -187,6 +652,44 @@ def print_obj( obj ):
 def print_text( text ):
     sys.stdout.write( text + "\n" )
 
+class ItemPrinter:
+
+    def __init__( self ):
+        self.writer = new_writer( k_item_fields ) if get_format() != "" else None
+
+    def folder( self, folder ):
+        if self.writer is None:
+            print_text( folder[ "title" ] + "/" )
+            return
+        record = { }
+        record[ "id" ] = folder[ "id" ]
+        record[ "title" ] = folder[ "title" ]
+        record[ "type" ] = "Folder"
+        self.writer.write( record )
+
+    def heading( self, folder ):
+        if self.writer is None:
+            print_text( "" )
+            print_text( folder[ "title" ] + ":" )
+
+    def item( self, item ):
+        if self.writer is None:
+            print_text( format_item( item ) )
+        else:
+            self.writer.write( item )
+
+    def flush( self ):
+        if self.writer is None:
+            sys.stdout.flush()
+        else:
+            self.writer.flush()
+
+    def close( self ):
+        if self.writer is None:
+            sys.stdout.flush()
+        else:
+            self.writer.close()
+
 def elapsed_str( ms ):
     sec = math.trunc( ms / 1000.0 )
     if sec < 60:
@@ -194,340 +697,423 @@ def elapsed_str( ms ):
     min = math.trunc( sec / 60.0 )
     return str(min) + " minutes"
 
-def get_folder_id( folder_title ):
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." );
+def ordered_map( func, values, jobs ):
+    if jobs <= 1:
+        for value in values:
+            yield func( value )
         return
-    username = get_default_username()
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.get( url, params=params )
-    if "folders" not in response.json():
-        print_obj( response.json() )
-        return ""
-    for folder in response.json()[ "folders" ]:
-        if folder[ "title" ] == folder_title:
-            return folder[ "id" ]
-    return ""
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor( max_workers=jobs )
+    pending = collections.deque()
+    try:
+        for value in values:
+            pending.append( executor.submit( func, value ) )
+            if len( pending ) >= jobs * 2:
+                yield pending.popleft().result()
+        while len( pending ) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown( wait=False )
 
-def get_item_id( item_title, folder_id=""):
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
+def get_retry_class():
+    global retry_class
+    if retry_class is not None:
+        return retry_class
+    from urllib3.util.retry import Retry
+    class PortalRetry( Retry ):
+        def is_retry( self, method, status_code, has_retry_after=False ):
+            if method is not None and method.upper() == "POST":
+                return bool( self.total ) and has_retry_after and status_code in k_post_retry_status
+            return Retry.is_retry( self, method, status_code, has_retry_after )
+    retry_class = PortalRetry
+    return retry_class
+
+def new_session( pool_size, retries ):
+    import requests
+    from requests.adapters import HTTPAdapter
+    retry_args = { }
+    retry_args[ "total" ] = retries
+    retry_args[ "backoff_factor" ] = 0.5
+    retry_args[ "status_forcelist" ] = k_retry_status
+    retry_args[ "raise_on_status" ] = False
+    retry_args[ "respect_retry_after_header" ] = True
+    retry = get_retry_class()( **retry_args )
+    adapter = HTTPAdapter( pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry )
+    adapter.poolmanager.pool_classes_by_scheme = get_trace_pool_classes()
+    session = requests.Session()
+    session.mount( "http://", adapter )
+    session.mount( "https://", adapter )
+    return session
+
+def get_trace_record():
+    return getattr( trace_local, "record", None )
+
+def add_trace_time( key, start ):
+    record = get_trace_record()
+    if record is not None:
+        record[ key ] = round( record.get( key, 0 ) + ( time.time() - start ) * 1000.0, 3 )
+
+def trace_new_conn( conn, base ):
+    if get_trace_record() is None:
+        return base._new_conn( conn )
+    host = getattr( conn, "_dns_host", conn.host )
+    start = time.time()
+    try:
+        addresses = socket.getaddrinfo( host, conn.port, 0, socket.SOCK_STREAM )
+    except socket.error:
+        addresses = [ ]
+    add_trace_time( "dns", start )
+    hosts = [ ]
+    for address in addresses:
+        if address[4][0] not in hosts:
+            hosts.append( address[4][0] )
+    connect_start = time.time()
+    try:
+        error = None
+        for address in hosts or [ host ]:
+            conn._dns_host = address
+            try:
+                return base._new_conn( conn )
+            except Exception as e:
+                error = e
+        raise error
+    finally:
+        conn._dns_host = host
+        add_trace_time( "connect", connect_start )
+
+def get_trace_pool_classes():
+    global trace_pool_classes
+    if trace_pool_classes is not None:
+        return trace_pool_classes
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    class TraceHTTPConnection( HTTPConnection ):
+        def _new_conn( self ):
+            return trace_new_conn( self, HTTPConnection )
+    class TraceHTTPSConnection( HTTPSConnection ):
+        def _new_conn( self ):
+            return trace_new_conn( self, HTTPSConnection )
+        def connect( self ):
+            record = get_trace_record()
+            start = time.time()
+            before = 0 if record is None else record.get( "dns", 0 ) + record.get( "connect", 0 )
+            HTTPSConnection.connect( self )
+            if record is not None:
+                after = record.get( "dns", 0 ) + record.get( "connect", 0 )
+                record[ "tls" ] = round( record.get( "tls", 0 ) + ( time.time() - start ) * 1000.0 - ( after - before ), 3 )
+    class TraceHTTPConnectionPool( HTTPConnectionPool ):
+        ConnectionCls = TraceHTTPConnection
+    class TraceHTTPSConnectionPool( HTTPSConnectionPool ):
+        ConnectionCls = TraceHTTPSConnection
+    trace_pool_classes = { }
+    trace_pool_classes[ "http" ] = TraceHTTPConnectionPool
+    trace_pool_classes[ "https" ] = TraceHTTPSConnectionPool
+    return trace_pool_classes
+
+def get_endpoint( url ):
+    path = re.sub( r"^https?://[^/]+(/[^/]+)?/sharing/rest", "", url.split( "?" )[0] )
+    path = re.sub( r"^/content/users/[^/]+", "/content/users/{user}", path )
+    return re.sub( r"/[0-9a-f]{32}(?=/|$)", "/{id}", path )
+
+def get_body_size( request ):
+    body = request.body
+    if isinstance( body, ( bytes, str ) ):
+        return len( body )
+    return int( request.headers.get( "Content-Length", 0 ) )
+
+def new_trace_record( method, url, retries=0 ):
+    record = { }
+    record[ "method" ] = method
+    record[ "endpoint" ] = get_endpoint( url )
+    record[ "start" ] = time.time()
+    record[ "thread" ] = threading.current_thread().ident
+    record[ "retries" ] = retries
+    record[ "bytesIn" ] = 0
+    record[ "bytesOut" ] = 0
+    return record
+
+def new_stats():
+    stats = { }
+    stats[ "requests" ] = 0
+    stats[ "errors" ] = 0
+    stats[ "retries" ] = 0
+    stats[ "bytesIn" ] = 0
+    stats[ "bytesOut" ] = 0
+    stats[ "time" ] = 0.0
+    stats[ "endpoints" ] = { }
+    return stats
+
+def add_stats( stats, record ):
+    for key in [ "", record[ "method" ] + " " + record[ "endpoint" ] ]:
+        counters = stats if key == "" else stats[ "endpoints" ].setdefault( key, new_stats() )
+        counters[ "requests" ] += 1
+        if "error" in record or record.get( "status", 0 ) >= 400:
+            counters[ "errors" ] += 1
+        counters[ "retries" ] += record[ "retries" ]
+        counters[ "bytesIn" ] += record[ "bytesIn" ]
+        counters[ "bytesOut" ] += record[ "bytesOut" ]
+        counters[ "time" ] = round( counters[ "time" ] + record[ "total" ], 3 )
+        if key != "":
+            counters.pop( "endpoints", None )
+            counters[ "maxTime" ] = max( counters.get( "maxTime", 0 ), record[ "total" ] )
+
+def start_trace():
+    global trace_records
+    with trace_lock:
+        trace_records = [ ]
+
+def trace_request( record ):
+    with trace_lock:
+        if trace_records is not None:
+            trace_records.append( record )
+        if "trace-file" not in args.get( "options", { } ):
+            return
+        options = args[ "options" ]
+        path = options[ "trace-file" ]
+        chrome = options.get( "trace-format", "jsonl" ) == "chrome"
+        if chrome:
+            event = { }
+            event[ "name" ] = record[ "method" ] + " " + record[ "endpoint" ]
+            event[ "cat" ] = "http"
+            event[ "ph" ] = "X"
+            event[ "ts" ] = int( record[ "start" ] * 1000000 )
+            event[ "dur" ] = int( record[ "total" ] * 1000 )
+            event[ "pid" ] = os.getpid()
+            event[ "tid" ] = record[ "thread" ]
+            event[ "args" ] = record
+            text = json.dumps( event, sort_keys=True ) + ",\n"
+            if not os.path.isfile( path ) or os.path.getsize( path ) == 0:
+                text = "[\n" + text
+        else:
+            text = json.dumps( record, sort_keys=True ) + "\n"
+        with open( path, "a" ) as trace_file:
+            trace_file.write( text )
+
+def end_trace():
+    global trace_records
+    with trace_lock:
+        records = trace_records
+        trace_records = None
+    if records is None or "trace" not in args[ "options" ]:
         return
-    username = get_default_username()
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    if folder_id != "":
-        url = url + "/" + folder_id
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.get( url, params=params )
-    for item in response.json()[ "items" ]:
-        if item[ "title" ] == item_title:
-            return item[ "id" ]
-    return ""
+    stats = new_stats()
+    for record in records:
+        add_stats( stats, record )
+    lines = [ ]
+    lines.append( "endpoint".ljust( 48 ) + "count".rjust( 7 ) + "errors".rjust( 7 ) + "retries".rjust( 8 ) + "in".rjust( 11 ) + "out".rjust( 11 ) + "total ms".rjust( 11 ) + "max ms".rjust( 10 ) )
+    endpoints = stats[ "endpoints" ]
+    for key in sorted( endpoints, key=lambda key: -endpoints[ key ][ "time" ] ):
+        counters = endpoints[ key ]
+        line = key[ : 47 ].ljust( 48 )
+        line = line + str( counters[ "requests" ] ).rjust( 7 )
+        line = line + str( counters[ "errors" ] ).rjust( 7 )
+        line = line + str( counters[ "retries" ] ).rjust( 8 )
+        line = line + format_bytes( counters[ "bytesIn" ] ).rjust( 11 )
+        line = line + format_bytes( counters[ "bytesOut" ] ).rjust( 11 )
+        line = line + ( "%.1f" % counters[ "time" ] ).rjust( 11 )
+        line = line + ( "%.1f" % counters[ "maxTime" ] ).rjust( 10 )
+        lines.append( line )
+    line = "total".ljust( 48 ) + str( stats[ "requests" ] ).rjust( 7 ) + str( stats[ "errors" ] ).rjust( 7 ) + str( stats[ "retries" ] ).rjust( 8 )
+    line = line + format_bytes( stats[ "bytesIn" ] ).rjust( 11 ) + format_bytes( stats[ "bytesOut" ] ).rjust( 11 ) + ( "%.1f" % stats[ "time" ] ).rjust( 11 )
+    lines.append( line )
+    sys.stderr.write( "\n".join( lines ) + "\n" )
+    sys.stderr.flush()
 
 def xstr( s ):
     return s if s is not None else ""
 
-def crack_folder( folder_path ):
-    regexp = r"(?:(?:/)?(.*))$"
-    m = re.match( regexp, folder_path )
-    folder_title = xstr( m.groups()[0] )
-    folder_id = ""
-    if folder_title != "":
-        folder_id = get_folder_id( folder_title )
-    result = { }
-    result[ "folder_title" ] = folder_title
-    result[ "folder_id" ] = folder_id
-    return result
-
-def crack_item( item_path ):
+def split_item_path( item_path ):
     regexp = r"(?:(?:/)?(.*[^/])(?:/))?([^\/]*)$"
     m = re.match( regexp, item_path )
-    folder_title = xstr( m.groups()[0] )
-    folder_id = ""
-    if folder_title != "":
-        folder_id = get_folder_id( folder_title )
-    item_title = xstr( m.groups()[1] )
-    item_id = get_item_id( item_title, folder_id )
+    return ( xstr( m.groups()[0] ), xstr( m.groups()[1] ) )
+
+def join_item_path( folder_title, item_title ):
+    return item_title if folder_title == "" else folder_title + "/" + item_title
+
+def parse_time( text ):
+    if re.match( r"^[0-9]+$", text ) is not None:
+        return int( text )
+    for time_format in [ "%Y-%m-%d %H:%M:%S", "%Y-%m-%d" ]:
+        try:
+            return int( time.mktime( time.strptime( text, time_format ) ) * 1000 )
+        except ValueError:
+            pass
+    raise AgtoolError( text + ": Invalid date." )
+
+def get_search_query( query="", item_type="", tags=None, owner="", modified_after=None, modified_before=None ):
+    terms = [ ]
+    if query != "":
+        terms.append( query )
+    if item_type != "":
+        terms.append( "type:\"" + item_type + "\"" )
+    for tag in tags or [ ]:
+        terms.append( "tags:\"" + tag + "\"" )
+    if owner != "":
+        terms.append( "owner:" + owner )
+    if modified_after is not None or modified_before is not None:
+        low = str( modified_after if modified_after is not None else 0 ).zfill( 19 )
+        high = str( modified_before if modified_before is not None else 9999999999999 ).zfill( 19 )
+        terms.append( "modified:[" + low + " TO " + high + "]" )
+    return " AND ".join( terms )
+
+def read_manifest( path ):
+    rows = [ ]
+    with open( path, "r" ) as manifest:
+        if path.endswith( ( ".jsonl", ".json" ) ):
+            for line in manifest:
+                if line.strip() != "":
+                    rows.append( json.loads( line ) )
+        else:
+            for row in csv.DictReader( manifest ):
+                rows.append( row )
+    return rows
+
+def read_done_rows( log_path ):
+    done = { }
+    if not os.path.isfile( log_path ):
+        return done
+    with open( log_path, "r" ) as log:
+        for line in log:
+            try:
+                record = json.loads( line )
+            except ValueError:
+                continue
+            if isinstance( record, dict ) and record.get( "success" ) == True and "row" in record:
+                done[ record[ "row" ] ] = record.get( "path" )
+    return done
+
+def get_row_fields( row ):
+    fields = { }
+    for key in row:
+        value = row[ key ]
+        if key is None or key in k_manifest_columns or value is None or value == "":
+            continue
+        fields[ key ] = ",".join( value ) if isinstance( value, list ) else value
+    return fields
+
+def get_row_error( task ):
+    row_num, path, row, item_obj = task
     result = { }
-    result[ "folder_title" ] = folder_title
-    result[ "folder_id" ] = folder_id
-    result[ "item_title" ] = item_title
-    result[ "item_id" ] = item_id
-    result[ "item_path" ] = item_title if folder_title == "" else folder_title + "/" + item_title
+    result[ "row" ] = row_num
+    result[ "path" ] = path
+    result[ "success" ] = False
+    if item_obj is None or path == "":
+        result[ "error" ] = "Missing path or id."
+    elif item_obj[ "folder_title" ] != "" and item_obj[ "folder_id" ] == "":
+        result[ "error" ] = "No such folder."
+    elif item_obj[ "item_id" ] == "":
+        result[ "error" ] = "No such item."
+    else:
+        return None
     return result
 
-def cmd_cat():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    if len( args[ "parameters" ] ) < 1:
-        print_error( "cat what?" )
-        return
-    item_obj = crack_item( args[ "parameters" ][1] )
-    folder_title = item_obj[ "folder_title" ]
-    folder_id = item_obj[ "folder_id" ]
-    if folder_title != "" and folder_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "cat: " + item_path + ": No such folder." )
-        return
-    item_id = item_obj[ "item_id" ]
-    if item_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "cat: " + item_path + ": No such item." )
-        return
-    url = portalUrl + "/sharing/rest/content/items/" + item_id + "/data"
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.get( url, params=params, stream=True )
-    # print response.text
-    # sys.stdout.write( response.text )
-    response.raw.decode_content = True
-    if "out" in args[ "options" ]:
-        with open( args[ "options"][ "out" ], "wb" ) as out:
-            out.write( response.raw.read() )
+def get_row_result( task, response ):
+    row_num, path, row, item_obj = task
+    result = { }
+    result[ "row" ] = row_num
+    result[ "path" ] = path
+    result[ "success" ] = "error" not in response
+    if "error" in response:
+        result[ "error" ] = response[ "error" ]
     else:
-        if sys.version_info >= (3,0):
-            sys.stdout.buffer.write( response.raw.read() )
-        else:
-            sys.stdout.write( response.raw.read() )
-        sys.stdout.flush()
+        result[ "itemId" ] = item_obj[ "item_id" ]
+    return result
 
-def cmd_info():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    if len( args[ "parameters" ] ) < 1:
-        print_error( "info what?" )
-        return
-    item_obj = crack_item( args[ "parameters" ][1] )
-    folder_title = item_obj[ "folder_title" ]
-    folder_id = item_obj[ "folder_id" ]
-    if folder_title != "" and folder_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "info: " + item_path + ": No such folder." )
-        return
-    item_id = item_obj[ "item_id" ]
-    if item_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "info: " + item_path + ": No such item." )
-        return
-    url = portalUrl + "/sharing/rest/content/items/" + item_id
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.get( url, params=params )
-    print_obj( response.json() )
+def is_missing_item( result ):
+    error = result.get( "error" ) if isinstance( result, dict ) else None
+    if not isinstance( error, dict ):
+        return False
+    return "does not exist" in xstr( error.get( "message" ) ).lower()
 
-def cmd_ls():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    folder_id = ""
-    if len( args[ "parameters" ] ) >= 2:
-        folder_obj = crack_folder( args[ "parameters" ][1] )
-        folder_id = folder_obj[ "folder_id" ]
-        folder_title = folder_obj[ "folder_title" ]
-        if folder_title != "":
-            if folder_id == "":
-                print_error( "ls: " + folder_title + ": No such folder." )
-                return
-            url = url + "/" + folder_id
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.get( url, params=params )
-    result = ""
-    if "folders" in response.json():
-        for folder in response.json()[ "folders" ]:
-            result = result + folder[ "title" ] + "/"  + "\n"
-    for item in response.json()[ "items" ]:
-        item_name = item[ "name" ]
-        if item_name is None:
-            item_name = ""
-        item_title = item[ "title" ]
-        if item_title is None:
-            item_title = ""
-        item_access = item[ "access" ]
-        item_owner = item[ "owner" ]
-        item_size = item[ "size" ]
-        item_size_text = str( item_size )
-        item_modified = item[ "modified" ]
-        item_modified_text = time.strftime( "%Y-%m-%d %H:%M:%S", time.localtime( item_modified / 1000.0 ) ) 
-        # result = result + item_name + " (" + item_title + ")" + "\n"
-        # result = result + item_access + " " + item_owner + " " + item_size_text + " " + item_modified_text + " " + item_name + " (" + item_title + ")" + "\n"
-        result = result + item_access.ljust(10)
-        result = result + " " + item_owner.ljust(10)
-        result = result + " " + item_size_text.rjust(10)
-        result = result + " " + item_modified_text.ljust(20)
-        result = result + " " + item_name
-        result = result + " (" + item_title + ")"
-        result = result + "\n"
-    print_text( result )
+def is_glob( text ):
+    return re.search( r"[*?[]", text ) is not None
 
-def _login():
-    global args
-    username = get_default_username()
-    if "username" in args[ "options" ]:
-        username = args[ "options" ][ "username" ]
-        set_default_username( username )
-    password = get_password()
-    if "password" in args[ "options" ]:
-        password = args[ "options" ][ "password" ]
-    if username == "" or password =="":
-        username = get_user_input( "Username: ", username )
-        set_default_username( username )
-    token = get_token()
-    expires = get_expires()
-    if token == "":
-        url = portalUrl + "/sharing/rest/info"
-        params = { }
-        params[ "f" ] = "pjson"
-        response = requests.get( url, params=params )
-        tokenServicesUrl = response.json()[ "authInfo" ][ "tokenServicesUrl" ]
-        if password == "":
-            password = getpass.getpass( "Password: " )
-        if password != "":
-            params = { }
-            params[ "username" ] = username
-            params[ "password" ] = password
-            params[ "referer" ] = portalUrl
-            params[ "f" ] = "pjson"
-            url = tokenServicesUrl
-            response = requests.post( url, params=params )
-            tokenInfo = response.json()
-            if "error" in tokenInfo:
-                print_obj( tokenInfo )
-                remove_password()
-                return
-            if "token" in tokenInfo:
-                token = tokenInfo[ "token" ]
-                set_token( token )
-            if "expires" in tokenInfo:
-                expires = tokenInfo[ "expires" ]
-                set_expires( expires )
-    if "forget" in args[ "options" ]:
-        remove_password()
-    if password !="":
-        if "save" in args[ "options" ]:
-            set_password( password )
+def format_bytes( n ):
+    for unit in [ "B", "KB", "MB", "GB" ]:
+        if n < 1024.0:
+            return "%.1f %s" % ( n, unit )
+        n = n / 1024.0
+    return "%.1f TB" % n
 
-def cmd_login():
-    _login()
-    token = get_token()
-    if token == "":
-        return
-    expires = get_expires()
-    sys.stdout.write( "Current token valid for " + elapsed_str( expires - time.time() * 1000.0 ) + "\n" )
+def new_progress( total=0, show=False ):
+    progress = { }
+    progress[ "bytes" ] = 0
+    progress[ "total" ] = total
+    progress[ "start" ] = time.time()
+    progress[ "shown" ] = 0
+    progress[ "tty" ] = show and sys.stderr.isatty()
+    progress[ "lock" ] = threading.Lock()
+    return progress
 
-def cmd_logout():
-    global args
-    username = get_default_username()
-    if "username" in args[ "options" ]:
-        username = args[ "options" ][ "username" ]
-        set_default_username( username )
-    remove_token()
-    remove_expires()
-    remove_password()
+def show_progress( progress ):
+    elapsed = max( time.time() - progress[ "start" ], 0.001 )
+    text = format_bytes( progress[ "bytes" ] )
+    if progress[ "total" ] > 0:
+        text = text + " / " + format_bytes( progress[ "total" ] )
+    text = text + "  " + format_bytes( progress[ "bytes" ] / elapsed ) + "/s"
+    sys.stderr.write( "\r" + text.ljust( 40 ) )
+    sys.stderr.flush()
 
-def cmd_mkdir():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    if len( args[ "parameters" ] ) < 1:
-        print_error( "mkdir what?" )
-        return
-    folder_obj = crack_folder( args[ "parameters" ][1] )
-    folder_title = folder_obj[ "folder_title" ]
-    folder_id = folder_obj[ "folder_id" ]
-    if folder_id != "":
-        print_error( "mkdir: " + folder_title + ": Cannot create directory. It already exists." )
-        return
-    url = portalUrl + "/sharing/rest/content/users/" + username + "/createFolder"
-    params = { }
-    params[ "title" ] = folder_title
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.post( url, params=params )
-    print_obj( response.json() )
+def update_progress( progress, size ):
+    with progress[ "lock" ]:
+        progress[ "bytes" ] += size
+        now = time.time()
+        if progress[ "tty" ] and now - progress[ "shown" ] >= 0.5:
+            progress[ "shown" ] = now
+            show_progress( progress )
 
-def cmd_rm():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    if len( args[ "parameters" ] ) < 1:
-        print_error( "rm what?" )
-        return
-    item_obj = crack_item( args[ "parameters" ][1] )
-    folder_title = item_obj[ "folder_title" ]
-    folder_id = item_obj[ "folder_id" ]
-    if folder_title != "" and folder_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "rm: " + item_path + ": No such folder." )
-        return
-    item_title = item_obj[ "item_title" ]
-    item_id = item_obj[ "item_id" ]
-    if item_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "rm: " + item_path + ": No such item." )
-        return
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    if folder_id != "":
-        url = url + "/" + folder_id
-    url = url + "/items/" + item_id + "/delete"
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.post( url, params=params )
-    print_obj( response.json() )
+def end_progress( progress ):
+    if progress[ "tty" ]:
+        show_progress( progress )
+        sys.stderr.write( "\n" )
 
-def cmd_rmdir():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    if len( args[ "parameters" ] ) < 1:
-        print_error( "rmdir what?" )
+def get_content_length( response ):
+    return int( response.headers.get( "Content-Length", 0 ) )
+
+def get_range_total( response ):
+    m = re.match( r"^bytes [0-9-]+/([0-9]+)$", response.headers.get( "Content-Range", "" ) )
+    return int( m.groups()[0] ) if m is not None else 0
+
+def new_segment_state( total, segments, validator ):
+    segment_size = int( math.ceil( total / float( segments ) ) )
+    state = { }
+    state[ "validator" ] = validator
+    state[ "total" ] = total
+    state[ "ranges" ] = [ ]
+    state[ "done" ] = [ ]
+    for start in range( 0, total, segment_size ):
+        state[ "ranges" ].append( [ start, min( start + segment_size, total ) - 1 ] )
+    return state
+
+def remove_download( part_path ):
+    for path in [ part_path, part_path + ".json" ]:
+        if os.path.isfile( path ):
+            os.remove( path )
+
+def check_data_response( response, statuses=( 200, ) ):
+    if response.status_code in statuses:
         return
-    folder_obj = crack_folder( args[ "parameters" ][1] )
-    folder_title = folder_obj[ "folder_title" ]
-    folder_id = folder_obj[ "folder_id" ]
-    if folder_id == "":
-        print_error( "rmdir: " + folder_title + ": No such folder." )
+    response.close()
+    raise AgtoolError( "Cannot read item data ( HTTP " + str( response.status_code ) + " )." )
+
+def copy_response( response, stream, progress ):
+    try:
+        for chunk in response.iter_content( chunk_size=k_download_chunk ):
+            if chunk:
+                stream.write( chunk )
+                update_progress( progress, len( chunk ) )
+    finally:
+        response.close()
+
+def replace_file( src, dst ):
+    if hasattr( os, "replace" ):
+        os.replace( src, dst )
         return
-    url = portalUrl + "/sharing/rest/content/users/" + username + "/" + folder_id + "/delete"
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    response = requests.post( url, params=params )
-    print_obj( response.json() )
+    if os.path.exists( dst ):
+        os.remove( dst )
+    os.rename( src, dst )
 
 def get_mime_type( filename ):
     mime_type = "application/octet-stream"
@@ -547,87 +1133,2578 @@ def get_file_stream( filepath, mime_type = "", filename = ""):
     stream = sys.stdin if filepath == "-" else open( filepath, "rb" )
     return ( filename, stream, mime_type )
 
-def get_files( args, item_title = "" ):
-    files = { }
-    if "file" in args[ "options" ]:
-        files[ "file" ] = get_file_stream( args[ "options" ][ "file" ], "", item_title )
-    if "thumbnail" in args[ "options" ]:
-        files[ "thumbnail" ] = get_file_stream( args[ "options" ][ "thumbnail" ] )
-    return files
+def get_file_hash( path ):
+    md5 = hashlib.md5()
+    with open( path, "rb" ) as stream:
+        for chunk in iter( lambda: stream.read( k_download_chunk ), b"" ):
+            md5.update( chunk )
+    return md5.hexdigest()
 
-def cmd_update():
-    global args
-    token = get_token_ex()
-    if token == "":
-        print_error( "Not logged in." )
-        return
-    username = get_default_username()
-    if len( args[ "parameters" ] ) < 1:
-        print_error( "update what?" )
-        return
-    item_obj = crack_item( args[ "parameters" ][1] )
-    folder_title = item_obj[ "folder_title" ]
-    folder_id = item_obj[ "folder_id" ]
-    if folder_title != "" and folder_id == "":
-        item_path = item_obj[ "item_path" ]
-        print_error( "update: " + item_path + ": No such folder." )
-        return
-    item_title = item_obj[ "item_title" ]
-    item_id = item_obj[ "item_id" ]
-    if item_id == "":
-        url = portalUrl + "/sharing/rest/content/users/" + username
+def get_file_state( path, entry=None ):
+    stat = os.stat( path )
+    state = { }
+    state[ "size" ] = stat.st_size
+    state[ "mtime" ] = stat.st_mtime
+    if entry is not None and entry.get( "size" ) == state[ "size" ] and entry.get( "mtime" ) == state[ "mtime" ]:
+        state[ "hash" ] = entry.get( "hash", "" )
+    else:
+        state[ "hash" ] = get_file_hash( path )
+    return state
+
+def file_reader( filepath, offset, size ):
+    def read():
+        with open( filepath, "rb" ) as stream:
+            stream.seek( offset )
+            return stream.read( size )
+    return read
+
+class Pipe:
+
+    def __init__( self, depth=k_pipe_depth ):
+        self.queue = queue.Queue( depth )
+        self.buffer = b""
+        self.eof = False
+        self.closed = False
+        self.error = None
+
+    def write( self, chunk ):
+        while not self.closed:
+            try:
+                self.queue.put( chunk, timeout=0.5 )
+                return
+            except queue.Full:
+                pass
+        raise IOError( "Pipe closed." )
+
+    def close_write( self, error=None ):
+        self.error = error
+        self.write( None )
+
+    def read( self, size=-1 ):
+        chunks = [ self.buffer ]
+        count = len( self.buffer )
+        while ( size < 0 or count < size ) and not self.eof:
+            chunk = self.queue.get()
+            if chunk is None:
+                self.eof = True
+                if self.error is not None:
+                    raise IOError( str( self.error ) )
+            else:
+                chunks.append( chunk )
+                count += len( chunk )
+        data = b"".join( chunks )
+        if size < 0:
+            size = len( data )
+        self.buffer = data[ size : ]
+        return data[ : size ]
+
+    def close( self ):
+        self.closed = True
+
+def pipe_response( response, pipe ):
+    try:
+        for chunk in response.iter_content( chunk_size=k_download_chunk ):
+            if chunk:
+                pipe.write( chunk )
+        pipe.close_write()
+    except Exception as e:
+        if not pipe.closed:
+            pipe.close_write( e )
+    finally:
+        response.close()
+
+def get_data_cache_dir( portal ):
+    return os.path.join( data_cache_path, re.sub( r"[^A-Za-z0-9.-]", "_", re.sub( r"^https?://", "", portal ) ) )
+
+def is_cache_temp( name ):
+    return name.endswith( ( ".tmp", ".part", ".part.json", ".lock" ) )
+
+def list_data_cache():
+    entries = [ ]
+    if not os.path.isdir( data_cache_path ):
+        return entries
+    for dirpath, dirnames, filenames in os.walk( data_cache_path ):
+        for name in filenames:
+            if is_cache_temp( name ):
+                continue
+            path = os.path.join( dirpath, name )
+            try:
+                stat = os.stat( path )
+            except OSError:
+                continue
+            entries.append( ( stat.st_mtime, stat.st_size, path ) )
+    return entries
+
+def prune_data_cache( limit ):
+    entries = sorted( list_data_cache() )
+    total = sum( size for mtime, size, path in entries )
+    removed = 0
+    for mtime, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove( path )
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    result = { }
+    result[ "removed" ] = removed
+    result[ "items" ] = len( entries ) - removed
+    result[ "bytes" ] = total
+    return result
+
+def get_data_cache_stats( limit ):
+    entries = list_data_cache()
+    stats = { }
+    stats[ "path" ] = data_cache_path
+    stats[ "items" ] = len( entries )
+    stats[ "bytes" ] = sum( size for mtime, size, path in entries )
+    stats[ "limit" ] = limit
+    if len( entries ) > 0:
+        stats[ "oldest" ] = int( min( entries )[0] * 1000 )
+        stats[ "newest" ] = int( max( entries )[0] * 1000 )
+    return stats
+
+def new_usage( top=0 ):
+    usage = { }
+    usage[ "items" ] = 0
+    usage[ "size" ] = 0
+    usage[ "types" ] = { }
+    usage[ "access" ] = { }
+    usage[ "top" ] = [ ]
+    usage[ "limit" ] = top
+    return usage
+
+def add_usage_total( totals, key, items, size ):
+    total = totals.setdefault( key, { "items": 0, "size": 0 } )
+    total[ "items" ] += items
+    total[ "size" ] += size
+
+def push_usage_top( usage, entry ):
+    if usage[ "limit" ] <= 0:
+        return
+    if len( usage[ "top" ] ) < usage[ "limit" ]:
+        heapq.heappush( usage[ "top" ], entry )
+    elif entry > usage[ "top" ][0]:
+        heapq.heappushpop( usage[ "top" ], entry )
+
+def add_usage_item( usage, item, folder_title ):
+    size = item.get( "size" ) or 0
+    if size < 0:
+        size = 0
+    usage[ "items" ] += 1
+    usage[ "size" ] += size
+    add_usage_total( usage[ "types" ], xstr( item.get( "type" ) ), 1, size )
+    add_usage_total( usage[ "access" ], xstr( item.get( "access" ) ), 1, size )
+    push_usage_top( usage, ( size, item[ "id" ], join_item_path( folder_title, xstr( item.get( "title" ) ) ), xstr( item.get( "type" ) ) ) )
+
+def merge_usage( usage, other ):
+    usage[ "items" ] += other[ "items" ]
+    usage[ "size" ] += other[ "size" ]
+    for key in [ "types", "access" ]:
+        for name in other[ key ]:
+            add_usage_total( usage[ key ], name, other[ key ][ name ][ "items" ], other[ key ][ name ][ "size" ] )
+    for entry in other[ "top" ]:
+        push_usage_top( usage, entry )
+
+def get_layer_url( item, layer ):
+    url = xstr( item.get( "url" ) or "" ).rstrip( "/" )
+    if url == "":
+        raise AgtoolError( xstr( item.get( "title" ) ) + ": No service url." )
+    if re.search( r"/[0-9]+$", url ) is None:
+        url = url + "/" + str( layer )
+    return url
+
+def get_oid_field( layer_info ):
+    if layer_info.get( "objectIdField" ):
+        return layer_info[ "objectIdField" ]
+    for field in layer_info.get( "fields" ) or [ ]:
+        if field.get( "type" ) == "esriFieldTypeOID":
+            return field[ "name" ]
+    return ""
+
+def get_export_format( out, output_format="" ):
+    if output_format == "":
+        output_format = "geojson" if isinstance( out, str ) and out.endswith( ( ".geojson", ".json" ) ) else "jsonl"
+    if output_format not in k_export_formats:
+        raise AgtoolError( output_format + ": Unknown export format." )
+    return output_format
+
+def export_page_params( plan, page, where ):
+    params = { }
+    if plan[ "mode" ] == "oid":
+        low = plan[ "min" ] + page * plan[ "step" ]
+        window = plan[ "field" ] + " >= " + str( low ) + " AND " + plan[ "field" ] + " < " + str( low + plan[ "step" ] )
+        params[ "where" ] = window if where == "1=1" else "(" + where + ") AND " + window
+    else:
+        params[ "where" ] = where
+        params[ "resultOffset" ] = page * plan[ "step" ]
+        params[ "resultRecordCount" ] = plan[ "step" ]
+    if plan[ "field" ] != "":
+        params[ "orderByFields" ] = plan[ "field" ]
+    return params
+
+def read_checkpoint( checkpoint_path, layer_url, output_format, where ):
+    state = load_json_file( checkpoint_path )
+    if state.get( "url" ) != layer_url or state.get( "format" ) != output_format or state.get( "where" ) != where:
+        return None
+    return state
+
+def write_checkpoint( checkpoint_path, state ):
+    with open( checkpoint_path + ".tmp", "w" ) as checkpoint:
+        checkpoint.write( json.dumps( state ) )
+    replace_file( checkpoint_path + ".tmp", checkpoint_path )
+
+def get_files( file_path, thumbnail_path, item_title = "" ):
+    files = { }
+    if file_path is not None:
+        files[ "file" ] = get_file_stream( file_path, "", item_title )
+    if thumbnail_path is not None:
+        files[ "thumbnail" ] = get_file_stream( thumbnail_path )
+    return files
+
+def is_token_error( response ):
+    content_type = response.headers.get( "Content-Type", "" )
+    if "json" not in content_type and "text/plain" not in content_type:
+        return False
+    try:
+        result = response.json()
+    except ValueError:
+        return False
+    if not isinstance( result, dict ) or not isinstance( result.get( "error" ), dict ):
+        return False
+    return result[ "error" ].get( "code" ) in k_token_error_codes
+
+def index_row( item, folder_id, info=None ):
+    row = [ ]
+    row.append( item[ "id" ] )
+    row.append( folder_id )
+    row.append( xstr( item.get( "title" ) ) )
+    row.append( xstr( item.get( "name" ) ) )
+    row.append( xstr( item.get( "type" ) ) )
+    row.append( item.get( "size", 0 ) )
+    row.append( xstr( item.get( "access" ) ) )
+    row.append( xstr( item.get( "owner" ) ) )
+    row.append( item.get( "modified", 0 ) )
+    row.append( ",".join( item.get( "tags" ) or [ ] ) )
+    row.append( json.dumps( info, sort_keys=True ) if info is not None else None )
+    return row
+
+def index_item( row ):
+    item = { }
+    item[ "id" ] = row[0]
+    item[ "ownerFolder" ] = row[1] if row[1] != "" else None
+    item[ "title" ] = row[2]
+    item[ "name" ] = row[3]
+    item[ "type" ] = row[4]
+    item[ "size" ] = row[5]
+    item[ "access" ] = row[6]
+    item[ "owner" ] = row[7]
+    item[ "modified" ] = row[8]
+    item[ "tags" ] = [ tag for tag in row[9].split( "," ) if tag != "" ]
+    return item
+
+class ContentIndex:
+
+    k_item_columns = "id, folder_id, title, name, type, size, access, owner, modified, tags"
+
+    def __init__( self, path, user_key ):
+        import sqlite3
+        dirname = os.path.dirname( path )
+        if dirname != "" and not os.path.exists( dirname ):
+            os.makedirs( dirname )
+        self.user_key = user_key
+        self.db = sqlite3.connect( path, timeout=30 )
+        self.db.execute( "CREATE TABLE IF NOT EXISTS folders ( user_key TEXT, id TEXT, title TEXT, PRIMARY KEY ( user_key, id ) )" )
+        self.db.execute( "CREATE TABLE IF NOT EXISTS items ( user_key TEXT, id TEXT, folder_id TEXT, title TEXT, name TEXT, type TEXT, size INTEGER, access TEXT, owner TEXT, modified INTEGER, tags TEXT, info TEXT, PRIMARY KEY ( user_key, id ) )" )
+        self.db.execute( "CREATE INDEX IF NOT EXISTS items_title ON items ( user_key, folder_id, title )" )
+        self.db.execute( "CREATE TABLE IF NOT EXISTS snapshots ( user_key TEXT PRIMARY KEY, modified INTEGER, refreshed INTEGER )" )
+        self.db.commit()
+
+    def close( self ):
+        self.db.close()
+
+    def get_snapshot( self ):
+        row = self.db.execute( "SELECT modified FROM snapshots WHERE user_key = ?", ( self.user_key, ) ).fetchone()
+        return row[0] if row is not None else None
+
+    def count_items( self ):
+        return self.db.execute( "SELECT COUNT(*) FROM items WHERE user_key = ?", ( self.user_key, ) ).fetchone()[0]
+
+    def get_item_folders( self ):
+        rows = self.db.execute( "SELECT id, folder_id FROM items WHERE user_key = ?", ( self.user_key, ) )
+        return dict( ( row[0], row[1] ) for row in rows )
+
+    def remove_items( self, item_ids ):
+        self.db.executemany( "DELETE FROM items WHERE user_key = ? AND id = ?", [ ( self.user_key, item_id ) for item_id in item_ids ] )
+
+    def set_folders( self, folders ):
+        self.db.execute( "DELETE FROM folders WHERE user_key = ?", ( self.user_key, ) )
+        self.db.executemany( "INSERT INTO folders VALUES ( ?, ?, ? )", [ ( self.user_key, folder[ "id" ], folder[ "title" ] ) for folder in folders ] )
+
+    def set_items( self, rows, replace=False ):
+        if replace:
+            self.db.execute( "DELETE FROM items WHERE user_key = ?", ( self.user_key, ) )
+        self.db.executemany( "INSERT OR REPLACE INTO items VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )", [ [ self.user_key ] + row for row in rows ] )
+
+    def set_snapshot( self, modified ):
+        self.db.execute( "INSERT OR REPLACE INTO snapshots VALUES ( ?, ?, ? )", ( self.user_key, modified, int( time.time() * 1000 ) ) )
+        self.db.commit()
+
+    def folders( self ):
+        rows = self.db.execute( "SELECT id, title FROM folders WHERE user_key = ? ORDER BY title", ( self.user_key, ) )
+        return [ { "id": row[0], "title": row[1] } for row in rows ]
+
+    def get_folder_id( self, folder_title ):
+        row = self.db.execute( "SELECT id FROM folders WHERE user_key = ? AND title = ?", ( self.user_key, folder_title ) ).fetchone()
+        return row[0] if row is not None else ""
+
+    def items( self, folder_id="" ):
+        rows = self.db.execute( "SELECT " + self.k_item_columns + " FROM items WHERE user_key = ? AND folder_id = ? ORDER BY rowid", ( self.user_key, folder_id ) )
+        for row in rows:
+            yield index_item( row )
+
+    def resolve_folder( self, folder_path ):
+        folder_title = folder_path.strip( "/" )
+        folder_id = self.get_folder_id( folder_title ) if folder_title != "" else ""
+        if folder_title != "" and folder_id == "":
+            raise AgtoolError( folder_title + ": No such folder." )
+        return folder_id
+
+    def info( self, item_path ):
+        folder_title, item_title = split_item_path( item_path )
+        folder_id = self.resolve_folder( folder_title )
+        row = self.db.execute( "SELECT " + self.k_item_columns + ", info FROM items WHERE user_key = ? AND folder_id = ? AND title = ? ORDER BY rowid", ( self.user_key, folder_id, item_title ) ).fetchone()
+        if row is None:
+            raise AgtoolError( join_item_path( folder_title, item_title ) + ": No such item." )
+        if row[10] is not None:
+            return json.loads( row[10] )
+        return index_item( row )
+
+    def find( self, query="", item_type="", tags=None, owner="", modified_after=None, modified_before=None, limit=0, sort_field="", sort_order="" ):
+        sql = "SELECT " + self.k_item_columns + " FROM items WHERE user_key = ?"
+        values = [ self.user_key ]
+        if query != "":
+            sql = sql + " AND ( title LIKE ? OR name LIKE ? )"
+            values = values + [ "%" + query + "%", "%" + query + "%" ]
+        if item_type != "":
+            sql = sql + " AND type = ?"
+            values.append( item_type )
+        for tag in tags or [ ]:
+            sql = sql + " AND ( ',' || tags || ',' ) LIKE ?"
+            values.append( "%," + tag + ",%" )
+        if owner != "":
+            sql = sql + " AND owner = ?"
+            values.append( owner )
+        if modified_after is not None:
+            sql = sql + " AND modified >= ?"
+            values.append( modified_after )
+        if modified_before is not None:
+            sql = sql + " AND modified <= ?"
+            values.append( modified_before )
+        if sort_field in k_index_sort_fields:
+            sql = sql + " ORDER BY " + sort_field + ( " DESC" if sort_order == "desc" else "" )
+        if limit > 0:
+            sql = sql + " LIMIT " + str( int( limit ) )
+        for row in self.db.execute( sql, values ):
+            yield index_item( row )
+
+class AgtoolError( Exception ):
+
+    def __init__( self, message, error=None ):
+        Exception.__init__( self, message )
+        self.error = error
+
+class Client:
+
+    def __init__( self, portal_url="", username="", password="", options=None ):
+        self.portal_url = normalize_portal_url( portal_url ) if portal_url != "" else portalUrl
+        self.username = username if username != "" else get_default_username( self.portal_url )
+        self.user_key = hash_portal_key( self.portal_url, self.username )
+        self.password = password
+        self.options = options if options is not None else { }
+        self.token = ""
+        self.expires = 0
+        self.session = None
+        self.lock = threading.Lock()
+        self.token_lock = threading.Lock()
+        self.timer = None
+        self.auth_info = None
+        self.hooks = [ ]
+        self.trace_timings = False
+        self.stats = new_stats()
+        self.stats_lock = threading.Lock()
+        self.index = None
+
+    def get_option( self, option, key, defaultValue ):
+        if option in self.options:
+            return self.options[ option ]
+        return get_settings( key, defaultValue )
+
+    def get_jobs( self ):
+        return max( int( self.get_option( "jobs", k_jobs, 4 ) ), 1 )
+
+    def get_session( self ):
+        with self.lock:
+            if self.session is None:
+                pool_size = max( int( self.get_option( "pool-size", k_pool_size, 10 ) ), self.get_jobs() )
+                retries = int( self.get_option( "retries", k_retries, 3 ) )
+                self.session = new_session( pool_size, retries )
+        return self.session
+
+    def add_hook( self, hook ):
+        self.hooks.append( hook )
+
+    def remove_hook( self, hook ):
+        self.hooks.remove( hook )
+
+    def get_stats( self ):
+        with self.stats_lock:
+            return json.loads( json.dumps( self.stats ) )
+
+    def reset_stats( self ):
+        with self.stats_lock:
+            self.stats = new_stats()
+
+    def send( self, method, url, retries=0, **kwargs ):
+        session = self.get_session()
+        record = new_trace_record( method, url, retries )
+        trace_local.record = record if self.trace_timings else None
+        streaming = False
+        try:
+            response = session.request( method, url, **kwargs )
+        except Exception as e:
+            record[ "error" ] = str( e )
+            raise
+        else:
+            record[ "status" ] = response.status_code
+            record[ "firstByte" ] = round( response.elapsed.total_seconds() * 1000.0, 3 )
+            history = getattr( getattr( response.raw, "retries", None ), "history", None )
+            record[ "retries" ] += len( history or ( ) )
+            record[ "bytesOut" ] = get_body_size( response.request )
+            if kwargs.get( "stream" ):
+                self.end_record_on_close( response, record )
+                streaming = True
+            else:
+                record[ "bytesIn" ] = len( response.content )
+            return response
+        finally:
+            trace_local.record = None
+            if not streaming:
+                self.end_record( record )
+
+    def end_record_on_close( self, response, record ):
+        close = response.close
+        def close_record():
+            try:
+                close()
+            finally:
+                if "total" not in record:
+                    tell = getattr( response.raw, "tell", None )
+                    record[ "bytesIn" ] = tell() if tell is not None else get_content_length( response )
+                    self.end_record( record )
+        response.close = close_record
+
+    def end_record( self, record ):
+        record[ "total" ] = round( ( time.time() - record[ "start" ] ) * 1000.0, 3 )
+        with self.stats_lock:
+            add_stats( self.stats, record )
+        for hook in list( self.hooks ):
+            hook( record )
+
+    def request( self, method, url, auth=True, **kwargs ):
+        if "timeout" not in kwargs:
+            kwargs[ "timeout" ] = float( self.get_option( "timeout", k_timeout, 60 ) )
+        if not auth:
+            return self.send( method, url, **kwargs )
+        key = "data" if "data" in kwargs else "params"
+        params = dict( kwargs.get( key ) or { } )
+        token = self.ensure_token()
+        params[ "token" ] = token
+        kwargs[ key ] = params
+        response = self.send( method, url, **kwargs )
+        if not is_token_error( response ) or self.get_password() == "":
+            return response
+        response.close()
+        params[ "token" ] = self.refresh_token( token )
+        for value in ( kwargs.get( "files" ) or { } ).values():
+            if isinstance( value, tuple ) and hasattr( value[1], "seek" ):
+                value[1].seek( 0 )
+        return self.send( method, url, 1, **kwargs )
+
+    def get( self, url, **kwargs ):
+        return self.request( "GET", url, **kwargs )
+
+    def post( self, url, **kwargs ):
+        return self.request( "POST", url, **kwargs )
+
+    def rest_url( self, path ):
+        return self.portal_url + "/sharing/rest" + path
+
+    def user_url( self, folder_id="" ):
+        url = self.rest_url( "/content/users/" + self.username )
         if folder_id != "":
             url = url + "/" + folder_id
-        url = url + "/addItem"
+        return url
+
+    def item_url( self, item_id ):
+        return self.rest_url( "/content/items/" + item_id )
+
+    def get_token( self ):
+        if self.token == "" or time.time() * 1000.0 >= self.expires:
+            self.token = get_user_settings( k_token, "", self.username, self.portal_url )
+            self.expires = get_user_settings( k_expires, 0, self.username, self.portal_url )
+        if self.token == "" or time.time() * 1000.0 >= self.expires:
+            return ""
+        return self.token
+
+    def get_password( self ):
+        if self.password != "":
+            return self.password
+        return get_user_settings( k_password, "", self.username, self.portal_url )
+
+    def ensure_token( self ):
+        token = self.get_token()
+        password = self.get_password()
+        if password != "":
+            if token == "":
+                token = self.refresh_token( token )
+            elif self.timer is None:
+                self.schedule_refresh()
+        if token == "":
+            raise AgtoolError( "Not logged in." )
+        return token
+
+    def refresh_token( self, token ):
+        with self.token_lock:
+            if self.token != token and self.get_token() != "":
+                return self.token
+            tokenInfo = self.login( self.get_password() )
+            if "error" in tokenInfo:
+                raise AgtoolError( "Cannot refresh token.", tokenInfo[ "error" ] )
+            return self.token
+
+    def schedule_refresh( self ):
+        if self.timer is not None:
+            self.timer.cancel()
+        remaining = self.expires / 1000.0 - time.time()
+        delay = remaining - k_refresh_margin if remaining > 2 * k_refresh_margin else remaining / 2
+        self.timer = threading.Timer( max( delay, 1 ), self.refresh_timer, [ self.token ] )
+        self.timer.daemon = True
+        self.timer.start()
+
+    def refresh_timer( self, token ):
+        self.timer = None
+        try:
+            self.refresh_token( token )
+        except Exception:
+            pass
+
+    def get_auth_info( self ):
+        if self.auth_info is None:
+            auth_info = get_cache_entry( "", "authInfo", self.portal_url, k_auth_info_ttl )
+            if auth_info is None:
+                portal_info = self.get_portal_info()
+                if "authInfo" not in portal_info:
+                    raise AgtoolError( "Cannot get portal info.", portal_info.get( "error" ) )
+                auth_info = portal_info[ "authInfo" ]
+                set_cache_entry( "", "authInfo", self.portal_url, auth_info )
+            self.auth_info = auth_info
+        return self.auth_info
+
+    def get_portal_info( self ):
         params = { }
-        params[ "type" ] = "Code Sample"
-        params[ "token" ] = token
-        params[ "title" ] = item_title
-        params[ "tags" ] = "code, sample"
         params[ "f" ] = "pjson"
-        for key in args[ "options" ]:
-            if not skip_option( key ):
-                params[key] = args[ "options" ][key]
-        files = get_files( args, item_title )
-        response = requests.post( url, params=params, files=files )
-        print_obj( response.json() )
-        return
-    url = portalUrl + "/sharing/rest/content/users/" + username
-    if folder_id != "":
-        url = url + "/" + folder_id
-    url = url + "/items/" + item_id + "/update"
-    params = { }
-    params[ "token" ] = token
-    params[ "f" ] = "pjson"
-    for key in args[ "options" ]:
-        if not skip_option( key ):
-            params[key] = args[ "options" ][key]
-    files = get_files( args, item_title )
-    response = requests.post( url, params=params, files=files )
-    print_obj( response.json() )
-
-load_settings()
-
-parse_args()
-parameters = args[ "parameters" ]
-if len(parameters) == 0:
-    cmd_login( )
-elif parameters[0] == "ls":
-    cmd_ls( )
-elif parameters[0] == "cat":
-    cmd_cat( )
-elif parameters[0] == "info":
-    cmd_info( )
-elif parameters[0] == "login":
-    cmd_login( )
-elif parameters[0] == "logout":
-    cmd_logout( )
-elif parameters[0] == "mkdir":
-    cmd_mkdir( )
-elif parameters[0] == "rm":
-    cmd_rm( )
-elif parameters[0] == "rmdir":
-    cmd_rmdir( )
-elif parameters[0] == "update":
-    cmd_update( )
+        response = self.get( self.rest_url( "/info" ), auth=False, params=params )
+        return response.json()
+
+    def login( self, password ):
+        tokenServicesUrl = self.get_auth_info()[ "tokenServicesUrl" ]
+        params = { }
+        params[ "username" ] = self.username
+        params[ "password" ] = password
+        params[ "referer" ] = self.portal_url
+        params[ "expiration" ] = int( self.get_option( "expiration", k_expiration, 60 ) )
+        params[ "f" ] = "pjson"
+        response = self.post( tokenServicesUrl, auth=False, params=params )
+        tokenInfo = response.json()
+        if "error" in tokenInfo:
+            return tokenInfo
+        self.password = password
+        if "token" in tokenInfo:
+            self.token = tokenInfo[ "token" ]
+            set_user_settings( k_token, self.token, self.username, self.portal_url )
+        if "expires" in tokenInfo:
+            self.expires = tokenInfo[ "expires" ]
+            set_user_settings( k_expires, self.expires, self.username, self.portal_url )
+        self.schedule_refresh()
+        return tokenInfo
+
+    def logout( self ):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.token = ""
+        self.expires = 0
+        self.password = ""
+        remove_user_settings( k_token, self.username, self.portal_url )
+        remove_user_settings( k_expires, self.username, self.portal_url )
+        remove_user_settings( k_password, self.username, self.portal_url )
+
+    def get_cache_entry( self, name, key ):
+        if "no-cache" in self.options:
+            return None
+        ttl = float( self.get_option( "cache-ttl", k_cache_ttl, 3600 ) )
+        return get_cache_entry( self.user_key, name, key, ttl )
+
+    def get_cached_folder_id( self, folder_title ):
+        return self.get_cache_entry( "folders", folder_title )
+
+    def set_cached_folder_id( self, folder_title, folder_id ):
+        set_cache_entry( self.user_key, "folders", folder_title, folder_id )
+
+    def remove_cached_folder( self, folder_title, folder_id ):
+        remove_cache_entry( self.user_key, "folders", folder_title )
+        remove_cache_prefix( self.user_key, "items", folder_id + "/" )
+
+    def get_cached_item_id( self, item_title, folder_id ):
+        return self.get_cache_entry( "items", item_cache_key( item_title, folder_id ) )
+
+    def set_cached_item_id( self, item_title, folder_id, item_id ):
+        set_cache_entry( self.user_key, "items", item_cache_key( item_title, folder_id ), item_id )
+
+    def remove_cached_item( self, item_title, folder_id ):
+        remove_cache_entry( self.user_key, "items", item_cache_key( item_title, folder_id ) )
+
+    def get_content_page( self, folder_id="", start=1, num=k_page_size ):
+        params = { }
+        params[ "start" ] = start
+        params[ "num" ] = num
+        params[ "f" ] = "pjson"
+        response = self.get( self.user_url( folder_id ), params=params )
+        return response.json()
+
+    def iter_content( self, folder_id="", jobs=1 ):
+        content = self.get_content_page( folder_id )
+        yield content
+        if "items" not in content or "nextStart" not in content:
+            return
+        start = content[ "nextStart" ]
+        if jobs > 1 and start > 0 and "total" in content and content[ "num" ] > 0:
+            starts = range( start, content[ "total" ] + 1, content[ "num" ] )
+            for content in ordered_map( lambda start: self.get_content_page( folder_id, start ), starts, jobs ):
+                yield content
+            return
+        while start > 0:
+            content = self.get_content_page( folder_id, start )
+            yield content
+            if "items" not in content or "nextStart" not in content:
+                return
+            start = content[ "nextStart" ]
+
+    def iter_items( self, folder_id="", jobs=1 ):
+        for content in self.iter_content( folder_id, jobs ):
+            if "items" not in content:
+                raise AgtoolError( "Cannot list content.", content.get( "error" ) )
+            for item in content[ "items" ]:
+                yield item
+
+    def search_page( self, query, start=1, num=k_page_size, sort_field="", sort_order="" ):
+        params = { }
+        params[ "q" ] = query
+        params[ "start" ] = start
+        params[ "num" ] = num
+        if sort_field != "":
+            params[ "sortField" ] = sort_field
+        if sort_order != "":
+            params[ "sortOrder" ] = sort_order
+        params[ "f" ] = "pjson"
+        response = self.get( self.rest_url( "/search" ), params=params )
+        return response.json()
+
+    def search( self, query, limit=0, sort_field="", sort_order="" ):
+        count = 0
+        start = 1
+        while start > 0:
+            num = k_page_size if limit <= 0 else min( k_page_size, limit - count )
+            content = self.search_page( query, start, num, sort_field, sort_order )
+            if "results" not in content:
+                raise AgtoolError( "Cannot search content.", content.get( "error" ) )
+            for item in content[ "results" ]:
+                yield item
+                count += 1
+                if limit > 0 and count >= limit:
+                    return
+            start = content.get( "nextStart", -1 )
+
+    def find( self, query="", item_type="", tags=None, owner="", modified_after=None, modified_before=None, limit=0, sort_field="", sort_order="" ):
+        query = get_search_query( query, item_type, tags, owner, modified_after, modified_before )
+        if query == "":
+            query = "owner:" + self.username
+        return self.search( query, limit, sort_field, sort_order )
+
+    def get_folders( self ):
+        content = self.get_content_page( "", 1, 1 )
+        if "folders" not in content:
+            raise AgtoolError( "Cannot list folders.", content.get( "error" ) )
+        for folder in content[ "folders" ]:
+            self.set_cached_folder_id( folder[ "title" ], folder[ "id" ] )
+        return content[ "folders" ]
+
+    def get_folder_id( self, folder_title ):
+        folder_id = self.get_cached_folder_id( folder_title )
+        if folder_id is not None:
+            return folder_id
+        for folder in self.get_folders():
+            if folder[ "title" ] == folder_title:
+                return folder[ "id" ]
+        return ""
+
+    def get_item_id( self, item_title, folder_id="" ):
+        return self.find_item( item_title, folder_id )[0]
+
+    def find_item( self, item_title, folder_id="" ):
+        item_id = self.get_cached_item_id( item_title, folder_id )
+        if item_id is not None:
+            return item_id, None
+        seen = { }
+        for item in self.iter_items( folder_id ):
+            title = xstr( item[ "title" ] )
+            if title in seen:
+                continue
+            seen[ title ] = item[ "id" ]
+            self.set_cached_item_id( title, folder_id, item[ "id" ] )
+            if title == item_title:
+                return item[ "id" ], item
+        return "", None
+
+    def list_items( self, folder_id="" ):
+        items = list( self.iter_items( folder_id, self.get_jobs() ) )
+        seen = { }
+        for item in items:
+            title = xstr( item[ "title" ] )
+            if title not in seen:
+                seen[ title ] = item[ "id" ]
+                self.set_cached_item_id( title, folder_id, item[ "id" ] )
+        return items
+
+    def crack_folder( self, folder_path ):
+        regexp = r"(?:(?:/)?(.*))$"
+        m = re.match( regexp, folder_path )
+        folder_title = xstr( m.groups()[0] )
+        folder_id = ""
+        if folder_title != "":
+            folder_id = self.get_folder_id( folder_title )
+        result = { }
+        result[ "folder_title" ] = folder_title
+        result[ "folder_id" ] = folder_id
+        return result
+
+    def crack_item( self, item_path ):
+        folder_title, item_title = split_item_path( item_path )
+        folder_id = ""
+        if folder_title != "":
+            folder_id = self.get_folder_id( folder_title )
+        item_id = ""
+        item = None
+        if folder_title == "" or folder_id != "":
+            item_id, item = self.find_item( item_title, folder_id )
+        result = { }
+        result[ "folder_title" ] = folder_title
+        result[ "folder_id" ] = folder_id
+        result[ "item_title" ] = item_title
+        result[ "item_id" ] = item_id
+        result[ "item_path" ] = join_item_path( folder_title, item_title )
+        if item is not None:
+            result[ "item" ] = item
+        elif item_id != "":
+            result[ "cached" ] = True
+        return result
+
+    def crack_items( self, item_paths, globs=True ):
+        listings = { }
+        results = [ ]
+        for item_path in item_paths:
+            folder_title, item_title = split_item_path( item_path )
+            folder_id = ""
+            if folder_title != "":
+                folder_id = self.get_folder_id( folder_title )
+            item_obj = { }
+            item_obj[ "folder_title" ] = folder_title
+            item_obj[ "folder_id" ] = folder_id
+            item_obj[ "item_title" ] = item_title
+            item_obj[ "item_id" ] = ""
+            item_obj[ "item_path" ] = join_item_path( folder_title, item_title )
+            if folder_title != "" and folder_id == "":
+                results.append( item_obj )
+                continue
+            glob = globs and is_glob( item_title )
+            if not glob:
+                item_id = self.get_cached_item_id( item_title, folder_id )
+                if item_id is not None:
+                    item_obj[ "item_id" ] = item_id
+                    item_obj[ "cached" ] = True
+                    results.append( item_obj )
+                    continue
+            if folder_id not in listings:
+                listings[ folder_id ] = self.list_items( folder_id )
+            matched = False
+            for item in listings[ folder_id ]:
+                title = xstr( item[ "title" ] )
+                if glob and not fnmatch.fnmatchcase( title, item_title ):
+                    continue
+                if not glob and title != item_title:
+                    continue
+                match_obj = item_obj.copy()
+                match_obj[ "item_title" ] = title
+                match_obj[ "item_id" ] = item[ "id" ]
+                match_obj[ "item_path" ] = join_item_path( folder_title, title )
+                match_obj[ "item" ] = item
+                results.append( match_obj )
+                matched = True
+                if not glob:
+                    break
+            if not matched:
+                results.append( item_obj )
+        return results
+
+    def resolve_folder( self, folder_path ):
+        folder_obj = self.crack_folder( folder_path )
+        if folder_obj[ "folder_title" ] != "" and folder_obj[ "folder_id" ] == "":
+            raise AgtoolError( folder_obj[ "folder_title" ] + ": No such folder." )
+        return folder_obj
+
+    def recrack_item( self, item_obj ):
+        if not item_obj.get( "cached" ):
+            return None
+        self.remove_cached_item( item_obj[ "item_title" ], item_obj[ "folder_id" ] )
+        return self.crack_item( item_obj[ "item_path" ] )
+
+    def resolve_item( self, item_path ):
+        item_obj = self.crack_item( item_path )
+        if item_obj[ "folder_title" ] != "" and item_obj[ "folder_id" ] == "":
+            raise AgtoolError( item_obj[ "item_path" ] + ": No such folder." )
+        if item_obj[ "item_id" ] == "":
+            raise AgtoolError( item_obj[ "item_path" ] + ": No such item." )
+        return item_obj
+
+    def folders( self ):
+        return self.get_folders()
+
+    def du( self, top=0 ):
+        folders = [ { "id": "", "title": "" } ] + self.get_folders()
+        def folder_usage( folder ):
+            usage = new_usage( top )
+            for item in self.iter_items( folder[ "id" ] ):
+                add_usage_item( usage, item, folder[ "title" ] )
+            return folder, usage
+        total = new_usage( top )
+        report = { }
+        report[ "folders" ] = [ ]
+        for folder, usage in ordered_map( folder_usage, folders, self.get_jobs() ):
+            row = { }
+            row[ "folder" ] = folder[ "title" ]
+            row[ "items" ] = usage[ "items" ]
+            row[ "size" ] = usage[ "size" ]
+            report[ "folders" ].append( row )
+            merge_usage( total, usage )
+        report[ "items" ] = total[ "items" ]
+        report[ "size" ] = total[ "size" ]
+        report[ "types" ] = total[ "types" ]
+        report[ "access" ] = total[ "access" ]
+        report[ "top" ] = [ ]
+        for size, item_id, path, item_type in sorted( total[ "top" ], reverse=True ):
+            report[ "top" ].append( { "path": path, "id": item_id, "type": item_type, "size": size } )
+        return report
+
+    def get_service_json( self, url, params=None ):
+        params = dict( params or { } )
+        params[ "f" ] = "json"
+        result = self.get( url, params=params ).json()
+        if "error" in result:
+            raise AgtoolError( url + ": " + xstr( result[ "error" ].get( "message" ) ) )
+        return result
+
+    def get_export_plan( self, layer_url, where ):
+        layer_info = self.get_service_json( layer_url )
+        step = max( int( layer_info.get( "maxRecordCount" ) or 1000 ), 1 )
+        plan = { }
+        plan[ "field" ] = get_oid_field( layer_info )
+        plan[ "step" ] = step
+        if plan[ "field" ] != "" and layer_info.get( "supportsStatistics", True ):
+            statistics = [ ]
+            for statistic in [ "min", "max" ]:
+                statistics.append( { "statisticType": statistic, "onStatisticField": plan[ "field" ], "outStatisticFieldName": statistic + "_oid" } )
+            params = { }
+            params[ "where" ] = where
+            params[ "outStatistics" ] = json.dumps( statistics )
+            try:
+                result = self.get_service_json( layer_url + "/query", params )
+                attributes = result[ "features" ][0][ "attributes" ]
+                attributes = dict( ( key.lower(), value ) for key, value in attributes.items() )
+            except ( AgtoolError, KeyError, IndexError ):
+                attributes = { }
+            if "min_oid" in attributes:
+                plan[ "mode" ] = "oid"
+                plan[ "min" ] = int( attributes[ "min_oid" ] or 0 )
+                plan[ "max" ] = int( attributes[ "max_oid" ] or -1 )
+                plan[ "pages" ] = max( ( plan[ "max" ] - plan[ "min" ] ) // step + 1, 0 )
+                return plan
+        params = { }
+        params[ "where" ] = where
+        params[ "returnCountOnly" ] = "true"
+        count = int( self.get_service_json( layer_url + "/query", params ).get( "count", 0 ) )
+        plan[ "mode" ] = "offset"
+        plan[ "pages" ] = ( count + step - 1 ) // step
+        return plan
+
+    def query_features( self, layer_url, params ):
+        params = dict( params )
+        params[ "outFields" ] = "*"
+        params[ "returnGeometry" ] = "true"
+        params[ "f" ] = "geojson"
+        features = [ ]
+        offset = params.get( "resultOffset", 0 )
+        while True:
+            result = self.get( layer_url + "/query", params=params ).json()
+            if "error" in result:
+                raise AgtoolError( layer_url + ": " + xstr( result[ "error" ].get( "message" ) ) )
+            page = result.get( "features" ) or [ ]
+            features.extend( page )
+            exceeded = result.get( "exceededTransferLimit" ) or result.get( "properties", { } ).get( "exceededTransferLimit" )
+            if not exceeded or len( page ) == 0 or params.get( "resultRecordCount", 0 ) > 0:
+                return features
+            offset += len( page )
+            params[ "resultOffset" ] = offset
+
+    def export( self, item_path, layer=0, out=None, where="1=1", format="" ):
+        item_obj = self.resolve_item( item_path )
+        if item_obj[ "item_id" ] == "":
+            raise AgtoolError( item_path + ": No such item." )
+        layer_url = get_layer_url( self.get_item_info( item_obj[ "item_id" ] ), layer )
+        output_format = get_export_format( out, format )
+        start = time.time()
+        state = None
+        checkpoint_path = None
+        if isinstance( out, str ):
+            checkpoint_path = out + ".checkpoint"
+            if os.path.isfile( out ):
+                state = read_checkpoint( checkpoint_path, layer_url, output_format, where )
+        if state is None:
+            state = { }
+            state[ "url" ] = layer_url
+            state[ "format" ] = output_format
+            state[ "where" ] = where
+            state[ "plan" ] = self.get_export_plan( layer_url, where )
+            state[ "page" ] = 0
+            state[ "offset" ] = 0
+            state[ "features" ] = 0
+        plan = state[ "plan" ]
+        stream = out
+        if checkpoint_path is not None:
+            stream = open( out, "r+b" if state[ "page" ] > 0 else "wb" )
+            stream.seek( state[ "offset" ] )
+            stream.truncate()
+        try:
+            if state[ "page" ] == 0 and output_format == "geojson":
+                stream.write( b"{\"type\":\"FeatureCollection\",\"features\":[\n" )
+            fetch_page = lambda page: self.query_features( layer_url, export_page_params( plan, page, where ) )
+            for features in ordered_map( fetch_page, range( state[ "page" ], plan[ "pages" ] ), self.get_jobs() ):
+                for feature in features:
+                    text = json.dumps( feature, separators=( ",", ":" ) )
+                    if output_format == "geojson":
+                        text = ( ",\n" if state[ "features" ] > 0 else "" ) + text
+                    else:
+                        text = text + "\n"
+                    stream.write( text.encode( "utf-8" ) )
+                    state[ "features" ] += 1
+                state[ "page" ] += 1
+                if checkpoint_path is not None:
+                    stream.flush()
+                    state[ "offset" ] = stream.tell()
+                    write_checkpoint( checkpoint_path, state )
+            if output_format == "geojson":
+                stream.write( b"\n]}\n" )
+            stream.flush()
+        finally:
+            if checkpoint_path is not None:
+                stream.close()
+        if checkpoint_path is not None and os.path.isfile( checkpoint_path ):
+            os.remove( checkpoint_path )
+        result = { }
+        result[ "url" ] = layer_url
+        result[ "path" ] = out if checkpoint_path is not None else ""
+        result[ "format" ] = output_format
+        result[ "features" ] = state[ "features" ]
+        result[ "pages" ] = plan[ "pages" ]
+        result[ "elapsed" ] = round( time.time() - start, 3 )
+        return result
+
+    def get_index( self ):
+        if self.index is None:
+            self.index = ContentIndex( index_path, self.user_key )
+        return self.index
+
+    def refresh_index( self, full=False, info=False ):
+        start = time.time()
+        index = self.get_index()
+        snapshot = index.get_snapshot()
+        folders = self.get_folders()
+        jobs = self.get_jobs()
+        changed = [ ]
+        removed = [ ]
+        if full or snapshot is None:
+            full = True
+            list_folder = lambda folder_id: [ ( item, folder_id ) for item in self.iter_items( folder_id ) ]
+            for items in ordered_map( list_folder, [ "" ] + [ folder[ "id" ] for folder in folders ], jobs ):
+                changed.extend( items )
+        else:
+            indexed = index.get_item_folders()
+            for item in self.search( "owner:" + self.username ):
+                folder_id = xstr( item.get( "ownerFolder" ) )
+                if indexed.pop( item[ "id" ], None ) != folder_id or item[ "modified" ] >= snapshot - k_index_overlap:
+                    changed.append( ( item, folder_id ) )
+            removed = list( indexed )
+        modified = max( [ item[ "modified" ] for item, folder_id in changed ] + [ snapshot or 0 ] )
+        infos = [ None ] * len( changed )
+        if info:
+            infos = list( ordered_map( lambda change: self.get_item_info( change[0][ "id" ] ), changed, jobs ) )
+        index.set_folders( folders )
+        index.remove_items( removed )
+        index.set_items( [ index_row( change[0], change[1], item_info ) for change, item_info in zip( changed, infos ) ], full )
+        index.set_snapshot( modified )
+        report = { }
+        report[ "full" ] = full
+        report[ "folders" ] = len( folders )
+        report[ "updated" ] = len( changed )
+        report[ "removed" ] = len( removed )
+        report[ "items" ] = index.count_items()
+        report[ "elapsed" ] = round( time.time() - start, 3 )
+        return report
+
+    def ls( self, folder_path="" ):
+        folder_obj = self.resolve_folder( folder_path )
+        return self.iter_items( folder_obj[ "folder_id" ], self.get_jobs() )
+
+    def info( self, item_path ):
+        return self.info_item( self.resolve_item( item_path ) )
+
+    def info_item( self, item_obj ):
+        if item_obj[ "folder_title" ] != "" and item_obj[ "folder_id" ] == "":
+            return { "path": item_obj[ "item_path" ], "error": "No such folder." }
+        if item_obj[ "item_id" ] == "":
+            return { "path": item_obj[ "item_path" ], "error": "No such item." }
+        result = self.get_item_info( item_obj[ "item_id" ] )
+        fresh = self.recrack_item( item_obj ) if is_missing_item( result ) else None
+        if fresh is not None:
+            return self.info_item( fresh )
+        return result
+
+    def get_item_info( self, item_id ):
+        params = { }
+        params[ "f" ] = "pjson"
+        response = self.get( self.item_url( item_id ), params=params )
+        return response.json()
+
+    def get_data_cache_limit( self ):
+        return int( float( self.get_option( "max-size", k_data_cache_size, 1024 ) ) * 1048576 )
+
+    def get_cached_data( self, item_obj, url, params, progress=False ):
+        item = item_obj.get( "item" ) or self.get_item_info( item_obj[ "item_id" ] )
+        limit = self.get_data_cache_limit()
+        if "modified" not in item or item.get( "size", 0 ) > limit:
+            return None
+        cache_dir = get_data_cache_dir( self.portal_url )
+        name = item_obj[ "item_id" ] + "-" + str( item[ "modified" ] )
+        path = os.path.join( cache_dir, name )
+        if os.path.isfile( path ):
+            os.utime( path, None )
+            return path
+        if not os.path.isdir( cache_dir ):
+            try:
+                os.makedirs( cache_dir )
+            except OSError:
+                pass
+        with open( path + ".lock", "a" ) as lock:
+            lock_file( lock )
+            try:
+                if not os.path.isfile( path ):
+                    self.download_file( url, params, path + ".tmp", progress )
+                    replace_file( path + ".tmp", path )
+            finally:
+                unlock_file( lock )
+        for other in os.listdir( cache_dir ):
+            if other.startswith( item_obj[ "item_id" ] + "-" ) and other != name and not other.startswith( name + "." ):
+                try:
+                    os.remove( os.path.join( cache_dir, other ) )
+                except OSError:
+                    pass
+        prune_data_cache( limit )
+        return path
+
+    def cat( self, item_path, out=None, progress=False ):
+        item_obj = self.resolve_item( item_path )
+        if "item" not in item_obj and "no-cache" not in self.options:
+            item = self.get_item_info( item_obj[ "item_id" ] )
+            fresh = self.recrack_item( item_obj ) if is_missing_item( item ) else None
+            if fresh is not None:
+                if fresh[ "item_id" ] == "":
+                    raise AgtoolError( fresh[ "item_path" ] + ": No such item." )
+                item_obj = fresh
+            else:
+                item_obj[ "item" ] = item
+        url = self.item_url( item_obj[ "item_id" ] ) + "/data"
+        params = { }
+        params[ "f" ] = "pjson"
+        cache_file = None
+        if "no-cache" not in self.options:
+            cache_file = self.get_cached_data( item_obj, url, params, progress )
+        if cache_file is not None:
+            import shutil
+            if isinstance( out, str ):
+                shutil.copyfile( cache_file, out )
+                return out
+            with open( cache_file, "rb" ) as data:
+                if out is None:
+                    return data.read()
+                shutil.copyfileobj( data, out, k_download_chunk )
+            return out
+        if isinstance( out, str ):
+            self.download_file( url, params, out, progress )
+            return out
+        stream = out
+        if stream is None:
+            import io
+            stream = io.BytesIO()
+        response = self.get( url, params=params, stream=True )
+        check_data_response( response )
+        download_progress = new_progress( get_content_length( response ), progress )
+        copy_response( response, stream, download_progress )
+        end_progress( download_progress )
+        return stream.getvalue() if out is None else stream
+
+    def probe_range( self, url, params ):
+        headers = { }
+        headers[ "Accept-Encoding" ] = "identity"
+        headers[ "Range" ] = "bytes=0-0"
+        response = self.get( url, params=params, headers=headers, stream=True )
+        response.close()
+        validator = response.headers.get( "ETag", response.headers.get( "Last-Modified", "" ) )
+        return response.status_code, get_range_total( response ), validator
+
+    def download_segment( self, url, params, part_path, segment, validator, progress ):
+        start, end = segment
+        headers = { }
+        headers[ "Accept-Encoding" ] = "identity"
+        headers[ "Range" ] = "bytes=" + str( start ) + "-" + str( end )
+        headers[ "If-Range" ] = validator
+        response = self.get( url, params=params, headers=headers, stream=True )
+        if response.status_code != 206:
+            response.close()
+            raise IOError( "Range request failed with HTTP " + str( response.status_code ) )
+        with open( part_path, "r+b" ) as out:
+            out.seek( start )
+            copy_response( response, out, progress )
+        return segment
+
+    def download_segments( self, url, params, part_path, state, jobs, show_progress ):
+        validator_path = part_path + ".json"
+        total = state[ "total" ]
+        if not os.path.isfile( part_path ) or os.path.getsize( part_path ) != total:
+            state[ "done" ] = [ ]
+            with open( part_path, "wb" ) as out:
+                out.truncate( total )
+        save_json_file( validator_path, state )
+        done = set( state[ "done" ] )
+        pending = [ tuple( segment ) for segment in state[ "ranges" ] if segment[0] not in done ]
+        progress = new_progress( total, show_progress )
+        progress[ "bytes" ] = total - sum( end - start + 1 for start, end in pending )
+        fetch = lambda segment: self.download_segment( url, params, part_path, segment, state[ "validator" ], progress )
+        for start, end in ordered_map( fetch, pending, jobs ):
+            state[ "done" ].append( start )
+            save_json_file( validator_path, state )
+        end_progress( progress )
+
+    def download_file( self, url, params, out_path, show_progress=False ):
+        part_path = out_path + ".part"
+        validator_path = part_path + ".json"
+        state = load_json_file( validator_path )
+        headers = { }
+        headers[ "Accept-Encoding" ] = "identity"
+        segments = int( self.get_option( "segments", k_segments, 1 ) )
+        if segments > 1 or "ranges" in state:
+            status, total, validator = self.probe_range( url, params )
+            resume = "ranges" in state and validator != "" and state.get( "validator" ) == validator and state.get( "total" ) == total
+            if status == 206 and ( resume or ( segments > 1 and total >= 2 * k_min_segment and validator != "" ) ):
+                if not resume:
+                    state = new_segment_state( total, min( segments, total // k_min_segment ), validator )
+                self.download_segments( url, params, part_path, state, segments, show_progress )
+                replace_file( part_path, out_path )
+                os.remove( validator_path )
+                return
+            if "ranges" in state:
+                remove_download( part_path )
+                state = { }
+        offset = 0
+        if os.path.isfile( part_path ):
+            offset = os.path.getsize( part_path )
+        if offset > 0:
+            headers[ "Range" ] = "bytes=" + str( offset ) + "-"
+            if "validator" in state:
+                headers[ "If-Range" ] = state[ "validator" ]
+        response = self.get( url, params=params, headers=headers, stream=True )
+        if response.status_code == 416:
+            response.close()
+            status, total, validator = self.probe_range( url, params )
+            if validator == "" or state.get( "validator" ) != validator or state.get( "total" ) != offset or total != offset:
+                remove_download( part_path )
+                return self.download_file( url, params, out_path, show_progress )
+        else:
+            check_data_response( response, ( 200, 206 ) )
+            mode = "ab"
+            if response.status_code == 200:
+                offset = 0
+                mode = "wb"
+                state = { }
+                state[ "validator" ] = response.headers.get( "ETag", response.headers.get( "Last-Modified", "" ) )
+                state[ "total" ] = get_content_length( response )
+                if state[ "validator" ] != "":
+                    save_json_file( validator_path, state )
+                elif os.path.isfile( validator_path ):
+                    os.remove( validator_path )
+            progress = new_progress( offset + get_content_length( response ), show_progress )
+            progress[ "bytes" ] = offset
+            with open( part_path, mode ) as out:
+                copy_response( response, out, progress )
+            end_progress( progress )
+        replace_file( part_path, out_path )
+        if os.path.isfile( validator_path ):
+            os.remove( validator_path )
+
+    def mkdir( self, folder_path ):
+        folder_obj = self.crack_folder( folder_path )
+        folder_title = folder_obj[ "folder_title" ]
+        if folder_obj[ "folder_id" ] != "":
+            raise AgtoolError( folder_title + ": Cannot create directory. It already exists." )
+        params = { }
+        params[ "title" ] = folder_title
+        params[ "f" ] = "pjson"
+        response = self.post( self.user_url() + "/createFolder", params=params )
+        result = response.json()
+        if "folder" in result:
+            self.set_cached_folder_id( folder_title, result[ "folder" ][ "id" ] )
+        return result
+
+    def rmdir( self, folder_path ):
+        folder_obj = self.crack_folder( folder_path )
+        folder_title = folder_obj[ "folder_title" ]
+        folder_id = folder_obj[ "folder_id" ]
+        if folder_id == "":
+            raise AgtoolError( folder_title + ": No such folder." )
+        params = { }
+        params[ "f" ] = "pjson"
+        response = self.post( self.user_url( folder_id ) + "/delete", params=params )
+        self.remove_cached_folder( folder_title, folder_id )
+        return response.json()
+
+    def post_item_batches( self, item_objs, url, params, error, on_success=None ):
+        batch_size = int( self.get_option( "batch-size", k_batch_size, 100 ) )
+        results = [ ]
+        targets = collections.OrderedDict()
+        for item_obj in item_objs:
+            result = { }
+            result[ "path" ] = item_obj[ "item_path" ]
+            if item_obj[ "folder_title" ] != "" and item_obj[ "folder_id" ] == "":
+                result[ "success" ] = False
+                result[ "error" ] = "No such folder."
+                results.append( result )
+            elif item_obj[ "item_id" ] == "":
+                result[ "success" ] = False
+                result[ "error" ] = "No such item."
+                results.append( result )
+            elif item_obj[ "item_id" ] not in targets:
+                targets[ item_obj[ "item_id" ] ] = item_obj
+        item_ids = list( targets )
+        batches = [ item_ids[ i : i + batch_size ] for i in range( 0, len( item_ids ), batch_size ) ]
+        def post_batch( batch ):
+            data = dict( params )
+            data[ "items" ] = ",".join( batch )
+            data[ "f" ] = "pjson"
+            response = self.post( url, data=data )
+            return response.json()
+        for batch, response in zip( batches, ordered_map( post_batch, batches, self.get_jobs() ) ):
+            statuses = { }
+            for status in response.get( "results", [ ] ):
+                statuses[ status[ "itemId" ] ] = status
+            for item_id in batch:
+                item_obj = targets[ item_id ]
+                result = { }
+                result[ "path" ] = item_obj[ "item_path" ]
+                result[ "itemId" ] = item_id
+                status = statuses.get( item_id, response )
+                result[ "success" ] = status.get( "success", False ) == True
+                for key in [ "notSharedWith", "notUnsharedFrom" ]:
+                    if len( status.get( key ) or [ ] ) > 0:
+                        result[ "success" ] = False
+                        result[ key ] = status[ key ]
+                if not result[ "success" ]:
+                    result[ "error" ] = status.get( "error", error )
+                elif on_success is not None:
+                    on_success( item_obj )
+                results.append( result )
+        stale = { }
+        for result in results:
+            item_obj = targets.get( result.get( "itemId" ) )
+            if item_obj is not None and not result[ "success" ] and is_missing_item( result ):
+                fresh = self.recrack_item( item_obj )
+                if fresh is not None:
+                    stale[ result[ "path" ] ] = fresh
+        if len( stale ) > 0:
+            retried = { }
+            for result in self.post_item_batches( list( stale.values() ), url, params, error, on_success ):
+                retried[ result[ "path" ] ] = result
+            results = [ retried.get( result[ "path" ], result ) if result[ "path" ] in stale else result for result in results ]
+        return results
+
+    def delete_items( self, item_objs ):
+        remove = lambda item_obj: self.remove_cached_item( item_obj[ "item_title" ], item_obj[ "folder_id" ] )
+        return self.post_item_batches( item_objs, self.user_url() + "/deleteItems", { }, "Not deleted.", remove )
+
+    def move_items( self, item_objs, folder_id ):
+        def move( item_obj ):
+            self.remove_cached_item( item_obj[ "item_title" ], item_obj[ "folder_id" ] )
+            self.set_cached_item_id( item_obj[ "item_title" ], folder_id, item_obj[ "item_id" ] )
+        params = { }
+        params[ "folder" ] = folder_id if folder_id != "" else "/"
+        return self.post_item_batches( item_objs, self.user_url() + "/moveItems", params, "Not moved.", move )
+
+    def delete_item( self, item_obj ):
+        url = self.user_url( item_obj[ "folder_id" ] ) + "/items/" + item_obj[ "item_id" ] + "/delete"
+        params = { }
+        params[ "f" ] = "pjson"
+        response = self.post( url, params=params )
+        self.remove_cached_item( item_obj[ "item_title" ], item_obj[ "folder_id" ] )
+        return response.json()
+
+    def rm( self, *item_paths ):
+        if len( item_paths ) == 1 and not is_glob( split_item_path( item_paths[0] )[1] ):
+            item_obj = self.resolve_item( item_paths[0] )
+            result = self.delete_item( item_obj )
+            fresh = self.recrack_item( item_obj ) if is_missing_item( result ) else None
+            if fresh is not None:
+                if fresh[ "item_id" ] == "":
+                    raise AgtoolError( fresh[ "item_path" ] + ": No such item." )
+                result = self.delete_item( fresh )
+            return result
+        results = self.delete_items( self.crack_items( item_paths ) )
+        failed = len( [ result for result in results if not result[ "success" ] ] )
+        report = { }
+        report[ "results" ] = results
+        report[ "deleted" ] = len( results ) - failed
+        report[ "failed" ] = failed
+        return report
+
+    def get_chunk_size( self, file_size ):
+        chunk_size = int( float( self.get_option( "chunk-size", k_chunk_size, 8 ) ) * 1048576 )
+        return max( chunk_size, int( math.ceil( file_size / float( k_max_parts ) ) ) )
+
+    def get_multipart_threshold( self ):
+        return float( self.get_option( "multipart-threshold", k_multipart_threshold, 64 ) ) * 1048576
+
+    def is_multipart_upload( self, file_path ):
+        if file_path is None or file_path == "-" or not os.path.isfile( file_path ):
+            return False
+        return os.path.getsize( file_path ) > self.get_multipart_threshold()
+
+    def upload_part( self, url, filename, part ):
+        import requests
+        part_num, read = part
+        retries = int( self.get_option( "retries", k_retries, 3 ) )
+        params = { }
+        params[ "partNum" ] = part_num
+        params[ "f" ] = "pjson"
+        attempt = 0
+        while True:
+            files = { }
+            files[ "file" ] = ( filename, read(), "application/octet-stream" )
+            try:
+                response = self.post( url, params=params, files=files )
+                result = response.json()
+            except ( requests.RequestException, ValueError ) as e:
+                result = { "error": { "message": str( e ) } }
+            if "error" not in result or attempt >= retries:
+                return result
+            attempt += 1
+            time.sleep( 0.5 * ( 2 ** attempt ) )
+
+    def upload_multipart( self, item_url, filepath, filename, params ):
+        file_size = os.path.getsize( filepath )
+        chunk_size = self.get_chunk_size( file_size )
+        parts = [ ]
+        for offset in range( 0, file_size, chunk_size ):
+            parts.append( ( len( parts ) + 1, file_reader( filepath, offset, min( chunk_size, file_size - offset ) ) ) )
+        return self.upload_parts( item_url, filename, parts, params )
+
+    def upload_parts( self, item_url, filename, parts, params ):
+        upload = lambda part: self.upload_part( item_url + "/addPart", filename, part )
+        for result in ordered_map( upload, parts, self.get_jobs() ):
+            if "error" in result:
+                return result
+        response = self.post( item_url + "/commit", params=params )
+        result = response.json()
+        if "error" in result:
+            return result
+        status_params = { }
+        status_params[ "f" ] = "pjson"
+        deadline = time.time() + float( self.get_option( "timeout", k_timeout, 60 ) )
+        delay = 0.5
+        while True:
+            response = self.get( item_url + "/status", params=status_params )
+            status = response.json()
+            if status.get( "status" ) != "processing":
+                break
+            if time.time() + delay > deadline:
+                return { "error": { "message": "Timed out waiting for item processing." } }
+            time.sleep( delay )
+            delay = min( delay * 2, 8 )
+        if "error" in status or status.get( "status" ) == "failed":
+            return status
+        return result
+
+    def get_group_ids( self, groups ):
+        group_ids = [ ]
+        titles = { }
+        for group in groups:
+            if re.match( r"^[0-9a-f]{32}$", group ) is not None:
+                group_ids.append( group )
+                continue
+            if len( titles ) == 0:
+                params = { }
+                params[ "f" ] = "pjson"
+                user = self.get( self.rest_url( "/community/self" ), params=params ).json()
+                if "groups" not in user:
+                    raise AgtoolError( "Cannot list groups.", user.get( "error" ) )
+                for user_group in user[ "groups" ]:
+                    titles[ user_group[ "title" ] ] = user_group[ "id" ]
+            if group not in titles:
+                raise AgtoolError( group + ": No such group." )
+            group_ids.append( titles[ group ] )
+        return group_ids
+
+    def share_items( self, item_objs, everyone=False, org=False, groups=None, unshare=False ):
+        group_ids = self.get_group_ids( groups or [ ] )
+        results = collections.OrderedDict()
+        calls = [ ]
+        if not unshare:
+            params = { }
+            if everyone:
+                params[ "everyone" ] = "true"
+            if everyone or org:
+                params[ "org" ] = "true"
+            params[ "groups" ] = ",".join( group_ids )
+            if everyone or org or len( group_ids ) > 0:
+                calls.append( ( "/shareItems", params ) )
+        else:
+            if everyone or org:
+                params = { }
+                params[ "everyone" ] = "false"
+                if org:
+                    params[ "org" ] = "false"
+                params[ "groups" ] = ""
+                calls.append( ( "/shareItems", params ) )
+            if len( group_ids ) > 0:
+                params = { }
+                params[ "groups" ] = ",".join( group_ids )
+                calls.append( ( "/unshareItems", params ) )
+        if len( calls ) == 0:
+            raise AgtoolError( "Specify --everyone, --org or --groups." )
+        for endpoint, params in calls:
+            for result in self.post_item_batches( item_objs, self.user_url() + endpoint, params, "Not shared." ):
+                if result[ "path" ] not in results or not result[ "success" ]:
+                    results[ result[ "path" ] ] = result
+        return list( results.values() )
+
+    def share( self, *item_paths, **kwargs ):
+        results = self.share_items( self.crack_items( item_paths ), **kwargs )
+        failed = len( [ result for result in results if not result[ "success" ] ] )
+        report = { }
+        report[ "results" ] = results
+        report[ "unshared" if kwargs.get( "unshare" ) else "shared" ] = len( results ) - failed
+        report[ "failed" ] = failed
+        return report
+
+    def unshare( self, *item_paths, **kwargs ):
+        kwargs[ "unshare" ] = True
+        return self.share( *item_paths, **kwargs )
+
+    def mv( self, *paths ):
+        if len( paths ) < 2:
+            raise AgtoolError( "Missing destination folder." )
+        folder_obj = self.resolve_folder( paths[-1] )
+        results = self.move_items( self.crack_items( paths[ : -1 ] ), folder_obj[ "folder_id" ] )
+        failed = len( [ result for result in results if not result[ "success" ] ] )
+        report = { }
+        report[ "results" ] = results
+        report[ "moved" ] = len( results ) - failed
+        report[ "failed" ] = failed
+        return report
+
+    def copy_item( self, item_obj, folder_id, item_title ):
+        params = { }
+        params[ "f" ] = "pjson"
+        response = self.get( self.item_url( item_obj[ "item_id" ] ), params=params )
+        info = response.json()
+        if "id" not in info:
+            return info
+        fields = { }
+        for field in k_copy_fields:
+            value = info.get( field )
+            if isinstance( value, list ):
+                value = ",".join( value )
+            if value is not None and value != "":
+                fields[ field ] = value
+        fields[ "title" ] = item_title
+        fields[ "f" ] = "pjson"
+        url = self.user_url( folder_id ) + "/addItem"
+        filename = xstr( info.get( "name" ) )
+        response = self.get( self.item_url( info[ "id" ] ) + "/data", params=params, stream=True )
+        if response.status_code != 200:
+            response.close()
+            return { "error": { "code": response.status_code, "message": "Cannot read item data." } }
+        if filename == "":
+            text = response.text
+            response.close()
+            if text != "":
+                fields[ "text" ] = text
+            result = self.post( url, params=fields ).json()
+            if "id" in result:
+                self.set_cached_item_id( item_title, folder_id, result[ "id" ] )
+            return result
+        pipe = Pipe()
+        thread = threading.Thread( target=pipe_response, args=( response, pipe ) )
+        thread.daemon = True
+        thread.start()
+        try:
+            size = info.get( "size", 0 )
+            commit_params = fields.copy()
+            fields[ "multipart" ] = "true"
+            fields[ "filename" ] = filename
+            result = self.post( url, params=fields ).json()
+            if "id" not in result:
+                return result
+            self.set_cached_item_id( item_title, folder_id, result[ "id" ] )
+            chunk_size = self.get_chunk_size( size )
+            def read_parts():
+                part_num = 1
+                while True:
+                    data = pipe.read( chunk_size )
+                    if len( data ) == 0:
+                        return
+                    yield ( part_num, lambda data=data: data )
+                    part_num += 1
+            item_url = self.user_url() + "/items/" + result[ "id" ]
+            status = self.upload_parts( item_url, filename, read_parts(), commit_params )
+            return status if "error" in status else result
+        finally:
+            pipe.close()
+
+    def cp( self, *paths ):
+        if len( paths ) < 2:
+            raise AgtoolError( "Missing destination." )
+        item_objs = self.crack_items( paths[ : -1 ] )
+        target = paths[-1]
+        item_title = ""
+        folder_obj = self.crack_folder( target.rstrip( "/" ) )
+        if not target.endswith( "/" ) and folder_obj[ "folder_id" ] == "" and folder_obj[ "folder_title" ] != "":
+            if len( item_objs ) != 1:
+                raise AgtoolError( target + ": No such folder." )
+            folder_title, item_title = split_item_path( target )
+            folder_obj = self.resolve_folder( folder_title )
+        elif folder_obj[ "folder_title" ] != "" and folder_obj[ "folder_id" ] == "":
+            raise AgtoolError( folder_obj[ "folder_title" ] + ": No such folder." )
+        folder_id = folder_obj[ "folder_id" ]
+        def copy( item_obj ):
+            result = { }
+            result[ "path" ] = item_obj[ "item_path" ]
+            result[ "success" ] = False
+            if item_obj[ "folder_title" ] != "" and item_obj[ "folder_id" ] == "":
+                result[ "error" ] = "No such folder."
+                return result
+            if item_obj[ "item_id" ] == "":
+                result[ "error" ] = "No such item."
+                return result
+            title = item_title if item_title != "" else item_obj[ "item_title" ]
+            result[ "target" ] = join_item_path( folder_obj[ "folder_title" ], title )
+            try:
+                response = self.copy_item( item_obj, folder_id, title )
+            except ( AgtoolError, IOError, OSError, ValueError ) as e:
+                response = { "error": str( e ) }
+            if "error" in response:
+                result[ "error" ] = response[ "error" ]
+            else:
+                result[ "success" ] = True
+                result[ "itemId" ] = response.get( "id", response.get( "itemId", "" ) )
+            return result
+        results = list( ordered_map( copy, item_objs, self.get_jobs() ) )
+        failed = len( [ result for result in results if not result[ "success" ] ] )
+        report = { }
+        report[ "results" ] = results
+        report[ "copied" ] = len( results ) - failed
+        report[ "failed" ] = failed
+        return report
+
+    def sync( self, local_dir, folder_path, pull=False, delete=False, dry_run=False ):
+        manifest_path = os.path.join( local_dir, k_sync_manifest )
+        manifest = load_json_file( manifest_path )
+        folder_obj = self.crack_folder( folder_path )
+        folder_title = folder_obj[ "folder_title" ]
+        folder_id = folder_obj[ "folder_id" ]
+        if folder_title != "" and folder_id == "" and pull:
+            raise AgtoolError( folder_title + ": No such folder." )
+        remote = collections.OrderedDict()
+        if folder_title == "" or folder_id != "":
+            for item in self.list_items( folder_id ):
+                title = xstr( item[ "title" ] )
+                if title not in remote:
+                    remote[ title ] = item
+        local = collections.OrderedDict()
+        if os.path.isdir( local_dir ):
+            for name in sorted( os.listdir( local_dir ) ):
+                if not name.startswith( k_sync_manifest ) and os.path.isfile( os.path.join( local_dir, name ) ):
+                    local[ name ] = os.path.join( local_dir, name )
+        elif not pull:
+            raise AgtoolError( local_dir + ": No such directory." )
+        tasks = [ ]
+        if pull:
+            for title in remote:
+                item = remote[ title ]
+                entry = manifest.get( title )
+                action = "download"
+                if title in local and entry is not None and entry.get( "modified" ) == item[ "modified" ]:
+                    state = get_file_state( local[ title ], entry )
+                    if state[ "hash" ] == entry.get( "hash" ):
+                        action = "unchanged"
+                tasks.append( ( action, title ) )
+            if delete:
+                for title in local:
+                    if title not in remote and title in manifest:
+                        tasks.append( ( "delete", title ) )
+        else:
+            for title in local:
+                entry = manifest.get( title )
+                action = "upload"
+                if title in remote and entry is not None and entry.get( "modified" ) == remote[ title ][ "modified" ]:
+                    state = get_file_state( local[ title ], entry )
+                    if state[ "hash" ] == entry.get( "hash" ):
+                        action = "unchanged"
+                        if state[ "mtime" ] != entry.get( "mtime" ):
+                            entry.update( state )
+                tasks.append( ( action, title ) )
+            if delete:
+                for title in remote:
+                    if title not in local:
+                        tasks.append( ( "delete", title ) )
+        if not dry_run and not pull and folder_title != "" and folder_id == "":
+            response = self.mkdir( folder_title )
+            if "folder" not in response:
+                raise AgtoolError( folder_title + ": Cannot create directory.", response.get( "error" ) )
+            folder_id = response[ "folder" ][ "id" ]
+        parts_dir = os.path.join( local_dir, k_sync_parts )
+        if not dry_run and pull and not os.path.isdir( parts_dir ):
+            os.makedirs( parts_dir )
+        def run_task( task ):
+            action, title = task
+            result = { }
+            result[ "path" ] = title
+            result[ "action" ] = action
+            if dry_run or action == "unchanged":
+                return result
+            item_path = join_item_path( folder_title, title )
+            local_path = os.path.join( local_dir, title )
+            try:
+                if action == "upload":
+                    item_obj = { }
+                    item_obj[ "folder_title" ] = folder_title
+                    item_obj[ "folder_id" ] = folder_id
+                    item_obj[ "item_title" ] = title
+                    item_obj[ "item_id" ] = remote[ title ][ "id" ] if title in remote else ""
+                    item_obj[ "item_path" ] = item_path
+                    response = self.update_item( item_obj, file=local_path )
+                    if "error" in response:
+                        result[ "error" ] = response[ "error" ]
+                    else:
+                        result[ "state" ] = get_file_state( local_path )
+                elif action == "download":
+                    item = remote[ title ]
+                    params = { }
+                    params[ "f" ] = "pjson"
+                    temp_path = os.path.join( parts_dir, title )
+                    self.download_file( self.item_url( item[ "id" ] ) + "/data", params, temp_path )
+                    replace_file( temp_path, local_path )
+                    result[ "state" ] = get_file_state( local_path )
+                    result[ "state" ][ "modified" ] = item[ "modified" ]
+                else:
+                    os.remove( local_path )
+            except ( AgtoolError, IOError, OSError, ValueError ) as e:
+                result[ "error" ] = str( e )
+            return result
+        deletes = [ ]
+        if not pull:
+            deletes = [ title for action, title in tasks if action == "delete" ]
+            tasks = [ task for task in tasks if task[0] != "delete" ]
+        results = list( ordered_map( run_task, tasks, self.get_jobs() ) )
+        if not dry_run and pull:
+            try:
+                os.rmdir( parts_dir )
+            except OSError:
+                pass
+        if len( deletes ) > 0:
+            item_objs = [ ]
+            for title in deletes:
+                item_obj = { }
+                item_obj[ "folder_title" ] = folder_title
+                item_obj[ "folder_id" ] = folder_id
+                item_obj[ "item_title" ] = title
+                item_obj[ "item_id" ] = remote[ title ][ "id" ]
+                item_obj[ "item_path" ] = join_item_path( folder_title, title )
+                item_objs.append( item_obj )
+            statuses = { }
+            if not dry_run:
+                for status in self.delete_items( item_objs ):
+                    statuses[ status[ "path" ] ] = status
+            for item_obj in item_objs:
+                result = { }
+                result[ "path" ] = item_obj[ "item_title" ]
+                result[ "action" ] = "delete"
+                status = statuses.get( item_obj[ "item_path" ], { "success": True } )
+                if not status[ "success" ]:
+                    result[ "error" ] = status[ "error" ]
+                results.append( result )
+        report = { }
+        report[ "results" ] = results
+        for result in results:
+            key = result[ "action" ] if "error" not in result else "failed"
+            report[ key ] = report.get( key, 0 ) + 1
+        if dry_run:
+            report[ "dryRun" ] = True
+            return report
+        uploaded = False
+        for result in results:
+            title = result[ "path" ]
+            if "error" in result:
+                continue
+            if result[ "action" ] == "delete":
+                manifest.pop( title, None )
+            elif "state" in result:
+                manifest[ title ] = result.pop( "state" )
+                uploaded = uploaded or result[ "action" ] == "upload"
+        if uploaded:
+            for item in self.list_items( folder_id ):
+                title = xstr( item[ "title" ] )
+                if title in manifest and title in local and "modified" not in manifest[ title ]:
+                    manifest[ title ][ "modified" ] = item[ "modified" ]
+            for title in manifest:
+                if "modified" not in manifest[ title ]:
+                    manifest[ title ][ "modified" ] = 0
+        if os.path.isdir( local_dir ):
+            save_json_file( manifest_path, manifest )
+        return report
+
+    def update( self, item_path, fields=None, file=None, thumbnail=None ):
+        item_obj = self.crack_item( item_path )
+        if item_obj[ "folder_title" ] != "" and item_obj[ "folder_id" ] == "":
+            raise AgtoolError( item_obj[ "item_path" ] + ": No such folder." )
+        result = self.update_item( item_obj, fields, file, thumbnail )
+        fresh = self.recrack_item( item_obj ) if is_missing_item( result ) else None
+        if fresh is not None:
+            return self.update_item( fresh, fields, file, thumbnail )
+        return result
+
+    def update_retry( self, item_obj, fields=None, file=None, thumbnail=None ):
+        import requests
+        retries = int( self.get_option( "retries", k_retries, 3 ) )
+        attempt = 0
+        while True:
+            try:
+                result = self.update_item( item_obj, fields, file, thumbnail )
+            except ( requests.RequestException, ValueError ) as e:
+                result = { "error": { "code": 0, "message": str( e ) } }
+            fresh = self.recrack_item( item_obj ) if is_missing_item( result ) else None
+            if fresh is not None:
+                item_obj = fresh
+                continue
+            error = result.get( "error" )
+            code = error.get( "code" ) if isinstance( error, dict ) else None
+            if code not in k_retry_status + ( 0, ) or attempt >= retries:
+                return result
+            attempt += 1
+            time.sleep( 0.5 * ( 2 ** attempt ) )
+
+    def update_rows( self, rows, done=None ):
+        def update_row( task ):
+            row_num, path, row, item_obj = task
+            result = get_row_error( task )
+            if result is not None:
+                return result
+            return get_row_result( task, self.update_retry( item_obj, get_row_fields( row ), row.get( "file" ) or None, row.get( "thumbnail" ) or None ) )
+        return ordered_map( update_row, self.get_update_tasks( rows, done ), self.get_jobs() )
+
+    def get_update_tasks( self, rows, done=None ):
+        done = done or { }
+        paths = [ ]
+        for row in rows:
+            if row.get( "id", "" ) == "" and row.get( "path", "" ) != "":
+                paths.append( row[ "path" ] )
+        item_objs = { }
+        for item_obj in self.crack_items( paths, False ):
+            item_objs[ item_obj[ "item_path" ] ] = item_obj
+        tasks = [ ]
+        for row_num in range( 1, len( rows ) + 1 ):
+            row = rows[ row_num - 1 ]
+            path = row.get( "path", "" ) or row.get( "id", "" )
+            if done.get( row_num ) == path:
+                continue
+            if row.get( "id", "" ) != "":
+                item_obj = { }
+                item_obj[ "folder_title" ] = ""
+                item_obj[ "folder_id" ] = ""
+                item_obj[ "item_title" ] = ""
+                item_obj[ "item_id" ] = row[ "id" ]
+                item_obj[ "item_path" ] = row[ "id" ]
+            else:
+                folder_title, item_title = split_item_path( path )
+                item_obj = item_objs.get( join_item_path( folder_title, item_title ) )
+            tasks.append( ( row_num, path, row, item_obj ) )
+        return tasks
+
+    def get_update_request( self, item_obj, fields=None ):
+        folder_id = item_obj[ "folder_id" ]
+        params = { }
+        if item_obj[ "item_id" ] == "":
+            params[ "type" ] = "Code Sample"
+            params[ "title" ] = item_obj[ "item_title" ]
+            params[ "tags" ] = "code, sample"
+            url = self.user_url( folder_id ) + "/addItem"
+        else:
+            url = self.user_url( folder_id ) + "/items/" + item_obj[ "item_id" ] + "/update"
+        params[ "f" ] = "pjson"
+        params.update( fields or { } )
+        return url, params
+
+    def update_cache( self, item_obj, params, result ):
+        if item_obj[ "item_id" ] == "":
+            if "id" in result:
+                self.set_cached_item_id( params[ "title" ], item_obj[ "folder_id" ], result[ "id" ] )
+        elif "title" in params:
+            self.remove_cached_item( item_obj[ "item_title" ], item_obj[ "folder_id" ] )
+
+    def update_item( self, item_obj, fields=None, file=None, thumbnail=None ):
+        item_id = item_obj[ "item_id" ]
+        files = get_files( file, thumbnail, item_obj[ "item_title" ] )
+        multipart = self.is_multipart_upload( file )
+        if multipart:
+            filename, stream, mime_type = files.pop( "file" )
+            stream.close()
+        url, params = self.get_update_request( item_obj, fields )
+        if item_id == "":
+            commit_params = params.copy()
+            if multipart:
+                params[ "multipart" ] = "true"
+                params[ "filename" ] = filename
+            response = self.post( url, params=params, files=files )
+            result = response.json()
+            self.update_cache( item_obj, params, result )
+            if "id" in result and multipart:
+                item_url = self.user_url() + "/items/" + result[ "id" ]
+                result = self.upload_multipart( item_url, file, filename, commit_params )
+            return result
+        if multipart:
+            params[ "multipart" ] = "true"
+            params[ "filename" ] = filename
+        response = self.post( url, params=params, files=files )
+        self.update_cache( item_obj, params, { } )
+        result = response.json()
+        if multipart and "error" not in result:
+            commit_params = { }
+            commit_params[ "f" ] = "pjson"
+            result = self.upload_multipart( self.user_url() + "/items/" + item_id, file, filename, commit_params )
+        return result
+
+def get_async_module():
+    sys.modules.setdefault( "agtool", sys.modules[ __name__ ] )
+    import agtool_async
+    return agtool_async
+
+def get_client():
+    options = args[ "options" ]
+    profile = { }
+    if "profile" in options:
+        profile = get_profile( options[ "profile" ] )
+        if profile is None and "portal" not in options:
+            raise AgtoolError( options[ "profile" ] + ": No such profile." )
+        profile = profile or { }
+    portal = normalize_portal_url( options.get( "portal", profile.get( "portal", portalUrl ) ) )
+    username = profile.get( "username", get_default_username( portal ) )
+    if "username" in options:
+        username = options[ "username" ]
+        set_default_username( username, portal )
+    key = ( portal, username )
+    if key not in clients:
+        clients[ key ] = Client( portal, username )
+        clients[ key ].add_hook( trace_request )
+    client = clients[ key ]
+    client.options = options
+    client.trace_timings = "trace" in options or "trace-file" in options
+    return client
+
+def get_token_ex():
+    token = get_client().get_token()
+    if token == "":
+        _login()
+        token = get_client().get_token()
+    return token
+
+def cmd_cat():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "cat what?" )
+        return
+    client = get_client()
+    if "out" in args[ "options" ]:
+        client.cat( args[ "parameters" ][1], args[ "options" ][ "out" ], True )
+        return
+    stream = sys.stdout.buffer if sys.version_info >= (3,0) else sys.stdout
+    client.cat( args[ "parameters" ][1], stream, True )
+    stream.flush()
+
+def cmd_export():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "export what?" )
+        return
+    options = args[ "options" ]
+    client = get_client()
+    layer = int( options.get( "layer", 0 ) )
+    where = options.get( "where", "1=1" )
+    output_format = options.get( "export-format", "" )
+    if "out" in options:
+        result = client.export( args[ "parameters" ][1], layer, options[ "out" ], where, output_format )
+        command_result[ "result" ] = result
+        print_text( json.dumps( result, indent=4, sort_keys=True ) )
+        return
+    stream = sys.stdout.buffer if sys.version_info >= (3,0) else sys.stdout
+    client.export( args[ "parameters" ][1], layer, stream, where, output_format )
+
+def cmd_info():
+    global args
+    if "offline" in args[ "options" ] and len( args[ "parameters" ] ) >= 2:
+        index = get_client().get_index()
+        if len( args[ "parameters" ] ) == 2:
+            print_obj( index.info( args[ "parameters" ][1] ) )
+            return
+        results = [ ]
+        for item_path in args[ "parameters" ][1:]:
+            try:
+                results.append( index.info( item_path ) )
+            except AgtoolError as e:
+                results.append( { "path": item_path, "error": str( e ) } )
+        print_obj( results )
+        return
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "info what?" )
+        return
+    client = get_client()
+    if len( args[ "parameters" ] ) == 2 and not is_glob( args[ "parameters" ][1] ):
+        print_obj( client.info( args[ "parameters" ][1] ) )
+        return
+    item_objs = client.crack_items( args[ "parameters" ][1:] )
+    if "async" in args[ "options" ]:
+        results = get_async_module().info_items( client, item_objs )
+    else:
+        results = list( ordered_map( client.info_item, item_objs, client.get_jobs() ) )
+    print_obj( results )
+
+def format_item( item ):
+    item_name = xstr( item[ "name" ] )
+    item_title = xstr( item[ "title" ] )
+    item_access = item[ "access" ]
+    item_owner = item[ "owner" ]
+    item_size_text = str( item[ "size" ] )
+    item_modified = item[ "modified" ]
+    item_modified_text = time.strftime( "%Y-%m-%d %H:%M:%S", time.localtime( item_modified / 1000.0 ) )
+    result = item_access.ljust(10)
+    result = result + " " + item_owner.ljust(10)
+    result = result + " " + item_size_text.rjust(10)
+    result = result + " " + item_modified_text.ljust(20)
+    result = result + " " + item_name
+    result = result + " (" + item_title + ")"
+    return result
+
+def cmd_ls_offline():
+    client = get_client()
+    index = client.get_index()
+    folder_id = ""
+    if len( args[ "parameters" ] ) >= 2:
+        folder_id = index.resolve_folder( args[ "parameters" ][1] )
+    folders = index.folders() if folder_id == "" else [ ]
+    printer = ItemPrinter()
+    try:
+        for folder in folders:
+            printer.folder( folder )
+        for item in index.items( folder_id ):
+            printer.item( item )
+        if "recursive" not in args[ "options" ]:
+            return
+        for folder in folders:
+            printer.heading( folder )
+            for item in index.items( folder[ "id" ] ):
+                printer.item( item )
+    finally:
+        printer.close()
+
+def cmd_ls():
+    global args
+    if "offline" in args[ "options" ]:
+        cmd_ls_offline()
+        return
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    client = get_client()
+    folder_id = ""
+    if len( args[ "parameters" ] ) >= 2:
+        folder_id = client.resolve_folder( args[ "parameters" ][1] )[ "folder_id" ]
+    folders = [ ]
+    printer = ItemPrinter()
+    try:
+        for content in client.iter_content( folder_id, client.get_jobs() ):
+            if "items" not in content:
+                print_obj( content )
+                return
+            if "folders" in content and content[ "start" ] == 1:
+                folders = content[ "folders" ]
+                for folder in folders:
+                    printer.folder( folder )
+            for item in content[ "items" ]:
+                printer.item( item )
+            printer.flush()
+        if "recursive" not in args[ "options" ]:
+            return
+        list_folder = lambda folder: ( folder, list( client.iter_items( folder[ "id" ] ) ) )
+        for folder, items in ordered_map( list_folder, folders, client.get_jobs() ):
+            printer.heading( folder )
+            for item in items:
+                printer.item( item )
+            printer.flush()
+    finally:
+        printer.close()
+
+def _login():
+    global args
+    client = get_client()
+    username = client.username
+    portal = client.portal_url
+    password = get_user_settings( k_password, "", username, portal )
+    if "password" in args[ "options" ]:
+        password = args[ "options" ][ "password" ]
+    if username == "" or password =="":
+        username = get_user_input( "Username: ", username )
+        args[ "options" ][ "username" ] = username
+        client = get_client()
+    token = client.get_token()
+    if token == "":
+        if password == "":
+            password = getpass.getpass( "Password: " )
+        if password != "":
+            tokenInfo = client.login( password )
+            if "error" in tokenInfo:
+                print_obj( tokenInfo )
+                remove_user_settings( k_password, username, portal )
+                return
+    if "forget" in args[ "options" ]:
+        remove_user_settings( k_password, username, portal )
+    if password !="":
+        if "save" in args[ "options" ]:
+            set_user_settings( k_password, password, username, portal )
+
+def cmd_login():
+    _login()
+    client = get_client()
+    token = client.get_token()
+    if token != "" and "profile" in args[ "options" ]:
+        profile = { }
+        profile[ "portal" ] = client.portal_url
+        profile[ "username" ] = client.username
+        set_profile( args[ "options" ][ "profile" ], profile )
+    save_settings()
+    if token == "":
+        return
+    sys.stdout.write( "Current token valid for " + elapsed_str( client.expires - time.time() * 1000.0 ) + "\n" )
+
+def cmd_logout():
+    get_client().logout()
+
+def cmd_mkdir():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "mkdir what?" )
+        return
+    print_obj( get_client().mkdir( args[ "parameters" ][1] ) )
+
+def cmd_rm():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "rm what?" )
+        return
+    result = get_client().rm( *args[ "parameters" ][1:] )
+    print_obj( result )
+    if result.get( "failed", 0 ) > 0:
+        record_error( "rm: " + str( result[ "failed" ] ) + " item(s) not deleted." )
+
+def cmd_mv():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 3:
+        print_error( "mv what?" )
+        return
+    result = get_client().mv( *args[ "parameters" ][1:] )
+    print_obj( result )
+    if result.get( "failed", 0 ) > 0:
+        record_error( "mv: " + str( result[ "failed" ] ) + " item(s) not moved." )
+
+def cmd_cp():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 3:
+        print_error( "cp what?" )
+        return
+    result = get_client().cp( *args[ "parameters" ][1:] )
+    print_obj( result )
+    if result.get( "failed", 0 ) > 0:
+        record_error( "cp: " + str( result[ "failed" ] ) + " item(s) not copied." )
+
+def cmd_share():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    command = args[ "parameters" ][0]
+    if len( args[ "parameters" ] ) < 2:
+        print_error( command + " what?" )
+        return
+    options = args[ "options" ]
+    groups = [ group.strip() for group in options.get( "groups", "" ).split( "," ) if group.strip() != "" ]
+    client = get_client()
+    share = client.unshare if command == "unshare" else client.share
+    result = share( *args[ "parameters" ][1:], everyone="everyone" in options, org="org" in options, groups=groups )
+    print_obj( result )
+    if result.get( "failed", 0 ) > 0:
+        record_error( command + ": " + str( result[ "failed" ] ) + " item(s) not " + command + "d." )
+
+def cmd_rmdir():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "rmdir what?" )
+        return
+    print_obj( get_client().rmdir( args[ "parameters" ][1] ) )
+
+def cmd_update():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if "from" in args[ "options" ]:
+        cmd_update_from()
+        return
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "update what?" )
+        return
+    options = args[ "options" ]
+    fields = get_fields( options )
+    result = get_client().update( args[ "parameters" ][1], fields, options.get( "file" ), options.get( "thumbnail" ) )
+    print_obj( result )
+
+def cmd_update_from():
+    options = args[ "options" ]
+    rows = read_manifest( options[ "from" ] )
+    done = read_done_rows( options[ "log" ] ) if "log" in options else { }
+    log = open( options[ "log" ], "a" ) if "log" in options else None
+    results = [ ]
+    def add_result( result ):
+        results.append( result )
+        if log is not None:
+            log.write( json.dumps( result, sort_keys=True ) + "\n" )
+            log.flush()
+    try:
+        if "async" in options:
+            get_async_module().update_rows( get_client(), rows, done, add_result )
+        else:
+            for result in get_client().update_rows( rows, done ):
+                add_result( result )
+    finally:
+        if log is not None:
+            log.close()
+    failed = len( [ result for result in results if not result[ "success" ] ] )
+    report = { }
+    report[ "results" ] = results
+    report[ "updated" ] = len( results ) - failed
+    report[ "failed" ] = failed
+    report[ "skipped" ] = len( rows ) - len( results )
+    print_obj( report )
+    if failed > 0:
+        record_error( "update: " + str( failed ) + " item(s) not updated." )
+
+def cmd_du():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    report = get_client().du( int( args[ "options" ].get( "top", 0 ) ) )
+    if get_format() != "":
+        records = [ ]
+        for row in report[ "folders" ]:
+            records.append( { "group": "folder", "name": row[ "folder" ], "items": row[ "items" ], "size": row[ "size" ] } )
+        for group, title in [ ( "types", "type" ), ( "access", "access" ) ]:
+            for name in sorted( report[ group ] ):
+                records.append( { "group": title, "name": name, "items": report[ group ][ name ][ "items" ], "size": report[ group ][ name ][ "size" ] } )
+        for row in report[ "top" ]:
+            records.append( { "group": "top", "name": row[ "path" ], "items": 1, "size": row[ "size" ] } )
+        records.append( { "group": "total", "name": "", "items": report[ "items" ], "size": report[ "size" ] } )
+        print_records( records, [ "group", "name", "items", "size" ] )
+        return
+    format_row = lambda size, items, name: format_bytes( size ).rjust( 12 ) + str( items ).rjust( 10 ) + "  " + name
+    for row in report[ "folders" ]:
+        print_text( format_row( row[ "size" ], row[ "items" ], row[ "folder" ] + "/" ) )
+    for group, title in [ ( "types", "type" ), ( "access", "access" ) ]:
+        print_text( "" )
+        print_text( title + ":" )
+        for name in sorted( report[ group ], key=lambda name: -report[ group ][ name ][ "size" ] ):
+            print_text( format_row( report[ group ][ name ][ "size" ], report[ group ][ name ][ "items" ], name ) )
+    if len( report[ "top" ] ) > 0:
+        print_text( "" )
+        print_text( "largest:" )
+        for row in report[ "top" ]:
+            print_text( format_row( row[ "size" ], 1, row[ "path" ] ) )
+    print_text( "" )
+    print_text( format_row( report[ "size" ], report[ "items" ], "total" ) )
+
+def cmd_find():
+    global args
+    options = args[ "options" ]
+    if "offline" not in options:
+        token = get_token_ex()
+        if token == "":
+            print_error( "Not logged in." )
+            return
+    query = " ".join( args[ "parameters" ][1:] )
+    tags = None
+    if "tags" in options:
+        tags = [ tag.strip() for tag in options[ "tags" ].split( "," ) if tag.strip() != "" ]
+    modified_after = parse_time( options[ "modified-after" ] ) if "modified-after" in options else None
+    modified_before = parse_time( options[ "modified-before" ] ) if "modified-before" in options else None
+    limit = int( options.get( "limit", 0 ) )
+    finder = get_client().get_index() if "offline" in options else get_client()
+    items = finder.find( query, options.get( "type", "" ), tags, options.get( "owner", "" ), modified_after, modified_before, limit, options.get( "sort-field", "" ), options.get( "sort-order", "" ) )
+    printer = ItemPrinter()
+    try:
+        for item in items:
+            printer.item( item )
+    finally:
+        printer.close()
+
+def cmd_index():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    options = args[ "options" ]
+    print_obj( get_client().refresh_index( "full" in options, "info" in options ) )
+
+def cmd_cache():
+    global args
+    action = args[ "parameters" ][1] if len( args[ "parameters" ] ) >= 2 else "stats"
+    client = get_client()
+    limit = client.get_data_cache_limit()
+    if action == "stats":
+        print_obj( get_data_cache_stats( limit ) )
+    elif action == "prune":
+        print_obj( prune_data_cache( limit ) )
+    elif action == "clear":
+        print_obj( prune_data_cache( 0 ) )
+    else:
+        print_error( "cache " + action + ": Unknown command." )
+
+def cmd_sync():
+    global args
+    token = get_token_ex()
+    if token == "":
+        print_error( "Not logged in." )
+        return
+    if len( args[ "parameters" ] ) < 3:
+        print_error( "sync what?" )
+        return
+    options = args[ "options" ]
+    result = get_client().sync( args[ "parameters" ][1], args[ "parameters" ][2], "pull" in options, "delete" in options, "dry-run" in options )
+    print_obj( result )
+    if result.get( "failed", 0 ) > 0:
+        record_error( "sync: " + str( result[ "failed" ] ) + " item(s) not synced." )
+
+def get_batch_portal( line, batch_options ):
+    try:
+        argv = shlex.split( line, comments=True )
+    except ValueError:
+        argv = [ "" ]
+    if len( argv ) == 0:
+        return None
+    options = { }
+    for i in range( len( argv ) - 1 ):
+        if argv[ i ] in [ "--portal", "--profile" ]:
+            options[ argv[ i ][2:] ] = argv[ i + 1 ]
+    for key in [ "portal", "profile" ]:
+        if key not in options and key in batch_options:
+            options[ key ] = batch_options[ key ]
+    if "profile" in options and "portal" not in options:
+        profile = get_profile( options[ "profile" ] )
+        if profile is not None and "portal" in profile:
+            options[ "portal" ] = profile[ "portal" ]
+    return normalize_portal_url( options.get( "portal", portalUrl ) )
+
+def get_line_error( line, line_num, error ):
+    result = { }
+    result[ "line" ] = line_num
+    result[ "command" ] = line.strip()
+    result[ "status" ] = "error"
+    result[ "error" ] = str( error )
+    result[ "elapsed" ] = 0
+    return result
+
+def run_batch_line( line, line_num, batch_options ):
+    try:
+        argv = shlex.split( line, comments=True )
+        if len( argv ) == 0:
+            return None
+        parse_args( argv )
+    except ValueError as e:
+        return get_line_error( line, line_num, e )
+    for key in batch_options:
+        if key not in k_batch_options and key not in args[ "options" ]:
+            args[ "options" ][ key ] = batch_options[ key ]
+    result = run_command_ex()
+    result[ "line" ] = line_num
+    save_settings()
+    return result
+
+def run_batch_groups( lines, groups, batch_options, log ):
+    import io
+    results = queue.Queue()
+    stop = threading.Event()
+    output = LocalOutput( sys.stdout )
+    def run_group( line_nums ):
+        args.bind( { } )
+        command_result.bind( { } )
+        for i in line_nums:
+            text = b""
+            result = None
+            try:
+                if stop.is_set():
+                    continue
+                stream = io.TextIOWrapper( io.BytesIO(), encoding="utf-8", write_through=True )
+                output.bind( stream )
+                try:
+                    result = run_batch_line( lines[ i ], i + 1, batch_options )
+                except Exception as e:
+                    result = get_line_error( lines[ i ], i + 1, e )
+                text = stream.buffer.getvalue()
+                if result is not None and result[ "status" ] != "ok" and "stop-on-error" in batch_options:
+                    stop.set()
+            finally:
+                results.put( ( i, text, result ) )
+    threads = [ ]
+    for line_nums in groups.values():
+        thread = threading.Thread( target=run_group, args=( line_nums, ) )
+        thread.daemon = True
+        threads.append( thread )
+    stdout = getattr( sys.stdout, "buffer", sys.stdout )
+    sys.stdout = output
+    if "trace" in batch_options:
+        start_trace()
+    try:
+        for thread in threads:
+            thread.start()
+        pending = { }
+        for i in sorted( i for line_nums in groups.values() for i in line_nums ):
+            while i not in pending:
+                line_num, text, result = results.get()
+                pending[ line_num ] = ( text, result )
+            text, result = pending.pop( i )
+            if len( text ) > 0:
+                stdout.write( text )
+                stdout.flush()
+            if result is not None:
+                log.write( json.dumps( result, sort_keys=True ) + "\n" )
+                log.flush()
+    finally:
+        sys.stdout = output.stream
+        if "trace" in batch_options:
+            end_trace()
+
+def cmd_batch():
+    global args
+    if len( args[ "parameters" ] ) < 2:
+        print_error( "batch what?" )
+        return
+    batch_args = args.get_dict()
+    batch_path = args[ "parameters" ][1]
+    batch_file = sys.stdin if batch_path == "-" else open( batch_path, "r" )
+    try:
+        lines = batch_file.readlines()
+    finally:
+        if batch_file is not sys.stdin:
+            batch_file.close()
+    groups = collections.OrderedDict()
+    for i in range( len( lines ) ):
+        portal = get_batch_portal( lines[ i ], batch_args[ "options" ] )
+        if portal is not None:
+            groups.setdefault( portal, [ ] ).append( i )
+    log = open( args[ "options" ][ "log" ], "a" ) if "log" in args[ "options" ] else sys.stderr
+    try:
+        if len( groups ) > 1:
+            run_batch_groups( lines, groups, batch_args[ "options" ], log )
+            return
+        for i in range( len( lines ) ):
+            result = run_batch_line( lines[ i ], i + 1, batch_args[ "options" ] )
+            if result is None:
+                continue
+            log.write( json.dumps( result, sort_keys=True ) + "\n" )
+            log.flush()
+            if result[ "status" ] != "ok" and "stop-on-error" in batch_args[ "options" ]:
+                break
+    finally:
+        args.set_dict( batch_args )
+        if log is not sys.stderr:
+            log.close()
+
+def cmd_help():
+    sys.stdout.write( k_usage )
+
+commands = { }
+commands[ "ls" ] = cmd_ls
+commands[ "cat" ] = cmd_cat
+commands[ "info" ] = cmd_info
+commands[ "export" ] = cmd_export
+commands[ "login" ] = cmd_login
+commands[ "logout" ] = cmd_logout
+commands[ "mkdir" ] = cmd_mkdir
+commands[ "rm" ] = cmd_rm
+commands[ "rmdir" ] = cmd_rmdir
+commands[ "mv" ] = cmd_mv
+commands[ "cp" ] = cmd_cp
+commands[ "share" ] = cmd_share
+commands[ "unshare" ] = cmd_share
+commands[ "update" ] = cmd_update
+commands[ "find" ] = cmd_find
+commands[ "du" ] = cmd_du
+commands[ "sync" ] = cmd_sync
+commands[ "index" ] = cmd_index
+commands[ "cache" ] = cmd_cache
+commands[ "batch" ] = cmd_batch
+commands[ "help" ] = cmd_help
+
+def run_command():
+    parameters = args[ "parameters" ]
+    if "help" in args[ "options" ]:
+        cmd_help( )
+        return
+    if len( parameters ) == 0:
+        cmd_login( )
+        return
+    if parameters[0] not in commands:
+        print_error( parameters[0] + ": Unknown command." )
+        return
+    tracing = "trace" in args[ "options" ] and parameters[0] != "batch" and not args.is_bound()
+    if tracing:
+        start_trace()
+    try:
+        get_format()
+        commands[ parameters[0] ]( )
+    except AgtoolError as e:
+        if e.error is not None:
+            print_obj( { "error": e.error } )
+        else:
+            print_error( parameters[0] + ": " + str( e ) )
+    finally:
+        if tracing:
+            end_trace()
+
+def run_command_ex():
+    command_result.set_dict( { } )
+    start = time.time()
+    if len( args[ "parameters" ] ) > 0 and args[ "parameters" ][0] == "batch":
+        print_error( "batch: Cannot be nested." )
+    else:
+        try:
+            run_command()
+        except IOError as e:
+            if e.errno == errno.EPIPE:
+                raise
+            record_error( str( e ) )
+        except Exception as e:
+            record_error( str( e ) )
+    result = command_result.get_dict()
+    result[ "command" ] = " ".join( args[ "parameters" ] )
+    result[ "status" ] = "error" if "error" in result else "ok"
+    result[ "elapsed" ] = round( time.time() - start, 3 )
+    return result
+
+def main():
+    try:
+        parse_args()
+    except ValueError as e:
+        print_error( str( e ) )
+        return
+    try:
+        run_command()
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+    finally:
+        save_state()
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import asyncio, json, os, shutil, tempfile, time
+
+from urllib.parse import urlparse
+
+from agtool import Client, get_files, get_row_error, get_row_fields, get_row_result, new_trace_record, k_concurrency, k_host_concurrency, k_retries, k_timeout, k_retry_status, k_token_error_codes, k_download_chunk
+
+class Throttle:
+
+    def __init__( self, limit ):
+        self.max_limit = limit
+        self.limit = limit
+        self.active = 0
+        self.successes = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire( self ):
+        async with self.condition:
+            await self.condition.wait_for( lambda: self.active < self.limit )
+            self.active += 1
+
+    async def release( self, throttled=False ):
+        async with self.condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max( self.limit // 2, 1 )
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+def get_error_code( result ):
+    if isinstance( result, dict ) and isinstance( result.get( "error" ), dict ):
+        return result[ "error" ].get( "code" )
+    return None
+
+def get_file_sources( files, temp_paths ):
+    sources = { }
+    for name in files:
+        filename, stream, mime_type = files[ name ]
+        stream = getattr( stream, "buffer", stream )
+        path = getattr( stream, "name", None )
+        if not isinstance( path, str ) or not os.path.isfile( path ):
+            with tempfile.NamedTemporaryFile( prefix="agtool-", delete=False ) as temp:
+                temp_paths.append( temp.name )
+                shutil.copyfileobj( stream, temp, k_download_chunk )
+            path = temp.name
+        sources[ name ] = ( filename, path, mime_type )
+    return sources
+
+def get_retry_delay( response, attempt ):
+    try:
+        return max( float( response.headers.get( "Retry-After", "" ) ), 0 )
+    except ValueError:
+        return 0.5 * ( 2 ** attempt )
+
+class AsyncClient( Client ):
+
+    def __init__( self, portal_url="", username="", password="", options=None ):
+        Client.__init__( self, portal_url, username, password, options )
+        self.async_session = None
+        self.throttles = { }
+
+    @classmethod
+    def from_client( cls, client ):
+        async_client = cls( client.portal_url, client.username, client.password, client.options )
+        async_client.token = client.token
+        async_client.expires = client.expires
+        async_client.hooks = client.hooks
+        async_client.stats = client.stats
+        async_client.stats_lock = client.stats_lock
+        return async_client
+
+    def get_concurrency( self ):
+        return max( int( self.get_option( "concurrency", k_concurrency, 32 ) ), 1 )
+
+    def get_host_concurrency( self ):
+        return max( int( self.get_option( "host-concurrency", k_host_concurrency, 16 ) ), 1 )
+
+    async def open( self ):
+        import aiohttp
+        if self.async_session is None:
+            connector = aiohttp.TCPConnector( limit=self.get_concurrency(), limit_per_host=self.get_host_concurrency() )
+            timeout = aiohttp.ClientTimeout( total=None, sock_connect=float( self.get_option( "timeout", k_timeout, 60 ) ), sock_read=float( self.get_option( "timeout", k_timeout, 60 ) ) )
+            self.async_session = aiohttp.ClientSession( connector=connector, timeout=timeout )
+        return self
+
+    def get_throttle( self, url ):
+        host = urlparse( url ).netloc.lower()
+        if host not in self.throttles:
+            self.throttles[ host ] = Throttle( min( self.get_concurrency(), self.get_host_concurrency() ) )
+        return self.throttles[ host ]
+
+    async def close( self ):
+        if self.async_session is not None:
+            await self.async_session.close()
+            self.async_session = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    async def __aenter__( self ):
+        return await self.open()
+
+    async def __aexit__( self, *exc_info ):
+        await self.close()
+
+    async def run_sync( self, func, *values ):
+        return await asyncio.get_event_loop().run_in_executor( None, func, *values )
+
+    async def fetch( self, method, url, auth=True, params=None, files=None ):
+        temp_paths = [ ]
+        try:
+            return await self.fetch_sources( method, url, auth, params, get_file_sources( files or { }, temp_paths ) )
+        finally:
+            for path in temp_paths:
+                os.remove( path )
+
+    async def fetch_sources( self, method, url, auth, params, sources ):
+        import aiohttp
+        await self.open()
+        retries = int( self.get_option( "retries", k_retries, 3 ) )
+        params = dict( params or { } )
+        throttle = self.get_throttle( url )
+        token = ""
+        if auth:
+            token = await self.run_sync( self.ensure_token )
+        attempt = 0
+        refreshed = False
+        while True:
+            if auth:
+                params[ "token" ] = token
+            data = None
+            streams = [ ]
+            if sources:
+                data = aiohttp.FormData()
+                for name in sources:
+                    filename, path, mime_type = sources[ name ]
+                    stream = open( path, "rb" )
+                    streams.append( stream )
+                    data.add_field( name, stream, filename=filename, content_type=mime_type )
+            record = new_trace_record( method, url, attempt )
+            throttled = False
+            await throttle.acquire()
+            try:
+                async with self.async_session.request( method, url, params=params, data=data ) as response:
+                    record[ "status" ] = response.status
+                    record[ "firstByte" ] = round( ( time.time() - record[ "start" ] ) * 1000.0, 3 )
+                    body = await response.read()
+                    record[ "bytesIn" ] = len( body )
+                    try:
+                        result = json.loads( body.decode( "utf-8" ) )
+                    except ValueError:
+                        result = { "error": { "code": response.status, "message": body.decode( "utf-8", "replace" )[ : 200 ] } }
+                    code = get_error_code( result )
+                    throttled = response.status in k_retry_status or code in k_retry_status
+                    delay = get_retry_delay( response, attempt )
+            except ( aiohttp.ClientError, asyncio.TimeoutError ) as e:
+                record[ "error" ] = str( e )
+                result = { "error": { "message": str( e ) } }
+                code = None
+                throttled = True
+                delay = 0.5 * ( 2 ** attempt )
+            finally:
+                for stream in streams:
+                    stream.close()
+                await throttle.release( throttled )
+                self.end_record( record )
+            if auth and code in k_token_error_codes and not refreshed and self.get_password() != "":
+                refreshed = True
+                token = await self.run_sync( self.refresh_token, token )
+                continue
+            if not throttled or attempt >= retries:
+                return result
+            attempt += 1
+            await asyncio.sleep( delay )
+
+    async def info_async( self, item_id ):
+        params = { }
+        params[ "f" ] = "pjson"
+        return await self.fetch( "GET", self.item_url( item_id ), params=params )
+
+    async def update_async( self, item_obj, fields=None, file=None, thumbnail=None ):
+        if self.is_multipart_upload( file ):
+            return await self.run_sync( self.update_item, item_obj, fields, file, thumbnail )
+        url, params = self.get_update_request( item_obj, fields )
+        files = get_files( file, thumbnail, item_obj[ "item_title" ] )
+        try:
+            result = await self.fetch( "POST", url, params=params, files=files )
+        finally:
+            for filename, stream, mime_type in files.values():
+                stream.close()
+        self.update_cache( item_obj, params, result )
+        return result
+
+    async def map_async( self, func, values ):
+        window = self.get_concurrency() * 2
+        pending = [ ]
+        try:
+            for value in values:
+                pending.append( asyncio.ensure_future( func( value ) ) )
+                if len( pending ) >= window:
+                    yield await pending.pop( 0 )
+            while len( pending ) > 0:
+                yield await pending.pop( 0 )
+        finally:
+            for future in pending:
+                future.cancel()
+
+def run( coroutine ):
+    if hasattr( asyncio, "run" ):
+        return asyncio.run( coroutine )
+    return asyncio.get_event_loop().run_until_complete( coroutine )
+
+def info_items( client, item_objs ):
+    async def run_all():
+        results = [ ]
+        async with AsyncClient.from_client( client ) as async_client:
+            async def info( item_obj ):
+                if item_obj[ "item_id" ] == "":
+                    return client.info_item( item_obj )
+                return await async_client.info_async( item_obj[ "item_id" ] )
+            async for result in async_client.map_async( info, item_objs ):
+                results.append( result )
+        return results
+    return run( run_all() )
+
+def update_rows( client, rows, done, on_result ):
+    async def run_all():
+        async with AsyncClient.from_client( client ) as async_client:
+            async def update( task ):
+                row_num, path, row, item_obj = task
+                result = get_row_error( task )
+                if result is not None:
+                    return result
+                response = await async_client.update_async( item_obj, get_row_fields( row ), row.get( "file" ) or None, row.get( "thumbnail" ) or None )
+                return get_row_result( task, response )
+            async for result in async_client.map_async( update, client.get_update_tasks( rows, done ) ):
+                on_result( result )
+    run( run_all() )
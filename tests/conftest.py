@@ -0,0 +1,36 @@
+import os, sys
+
+import pytest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import agbench
+
+def start_portal():
+    portal = agbench.MockPortal( items=3, folders=1, folder_items=2, item_size=1000 )
+    portal.start()
+    return portal
+
+@pytest.fixture
+def portal():
+    portal = start_portal()
+    yield portal
+    portal.stop()
+
+@pytest.fixture
+def other_portal():
+    portal = start_portal()
+    yield portal
+    portal.stop()
+
+@pytest.fixture
+def agtool( portal, other_portal, tmp_path ):
+    home = str( tmp_path )
+    def run( *argv, **kwargs ):
+        target = kwargs.get( "portal", portal )
+        return agbench.run_agtool( list( argv ) + [ "--portal", target.url ], home, kwargs.get( "stdin" ) )
+    for target in [ portal, other_portal ]:
+        result = run( "login", "--username", agbench.k_username, "--password", "test", "--save", portal=target )
+        assert result[ "returncode" ] == 0
+    run.home = home
+    return run
@@ -0,0 +1,85 @@
+import json, os
+
+import agbench
+
+def read_records( text ):
+    return [ json.loads( line ) for line in text.decode( "utf-8" ).splitlines() if line.startswith( "{" ) ]
+
+def test_cat( portal, agtool ):
+    item = portal.get_item( "item1" )
+    result = agtool( "cat", "item1" )
+    assert result[ "returncode" ] == 0
+    assert result[ "stdout" ] == portal.read_data( item, 0, item[ "size" ] )
+
+def test_cat_resumes_partial_download( portal, agtool ):
+    item = portal.add_item( "", "big", 1048576 )
+    out_path = os.path.join( agtool.home, "big.bin" )
+    portal.truncate_data = 300000
+    agtool( "cat", "big", "--out", out_path, "--no-cache" )
+    assert 0 < os.path.getsize( out_path + ".part" ) <= 300000
+    portal.reset_stats()
+    result = agtool( "cat", "big", "--out", out_path, "--no-cache" )
+    assert result[ "returncode" ] == 0
+    assert agbench.file_digest( out_path ) == portal.digest_data( item )
+    assert portal.get_stats()[ "bytesOut" ] < item[ "size" ]
+    assert not os.path.exists( out_path + ".part" )
+
+def test_multipart_upload( portal, agtool ):
+    path = os.path.join( agtool.home, "upload.bin" )
+    agbench.make_file( path, 3 * 1048576 + 1000 )
+    portal.reset_stats()
+    result = agtool( "update", "upload.bin", "--file", path, "--multipart-threshold", "1", "--chunk-size", "1" )
+    assert result[ "returncode" ] == 0
+    item = portal.get_item( "upload.bin" )
+    assert portal.digest_data( item ) == agbench.file_digest( path )
+    endpoints = portal.get_stats()[ "endpoints" ]
+    assert endpoints[ "POST /sharing/rest/content/users/{user}/items/{id}/addPart" ] == 4
+
+def test_sync_push_and_pull( portal, agtool ):
+    local_dir = os.path.join( agtool.home, "local" )
+    os.makedirs( local_dir )
+    for name, size in [ ( "a.bin", 5000 ), ( "b.bin", 70000 ) ]:
+        agbench.make_file( os.path.join( local_dir, name ), size )
+    result = agtool( "sync", local_dir, "folder0" )
+    assert result[ "returncode" ] == 0
+    folder_id = [ folder[ "id" ] for folder in portal.folders.values() if folder[ "title" ] == "folder0" ][0]
+    for name in [ "a.bin", "b.bin" ]:
+        item = portal.get_item( name, folder_id )
+        assert portal.digest_data( item ) == agbench.file_digest( os.path.join( local_dir, name ) )
+    pull_dir = os.path.join( agtool.home, "pull" )
+    os.makedirs( pull_dir )
+    result = agtool( "sync", pull_dir, "folder0", "--pull" )
+    assert result[ "returncode" ] == 0
+    for name in [ "a.bin", "b.bin" ]:
+        assert agbench.file_digest( os.path.join( pull_dir, name ) ) == agbench.file_digest( os.path.join( local_dir, name ) )
+
+def test_batch_keeps_line_order_across_portals( portal, other_portal, agtool ):
+    lines = "cat item0\ncat item1 --portal " + other_portal.url + "\ninfo nosuch\ncat item2 --portal " + other_portal.url + "\n"
+    result = agtool( "batch", "-", stdin=lines )
+    assert result[ "returncode" ] == 0
+    expected = portal.read_data( portal.get_item( "item0" ), 0, 1000 )
+    expected = expected + other_portal.read_data( other_portal.get_item( "item1" ), 0, 1000 )
+    expected = expected + b"info: nosuch: No such item.\n"
+    expected = expected + other_portal.read_data( other_portal.get_item( "item2" ), 0, 1000 )
+    assert result[ "stdout" ] == expected
+    records = read_records( result[ "stderr" ] )
+    assert [ record[ "line" ] for record in records ] == [ 1, 2, 3, 4 ]
+    assert [ record[ "status" ] for record in records ] == [ "ok", "ok", "error", "ok" ]
+
+def test_export( portal, agtool ):
+    portal.add_feature_service( "", "layer", 250, 100 )
+    out_path = os.path.join( agtool.home, "layer.geojson" )
+    result = agtool( "export", "layer", "--out", out_path )
+    assert result[ "returncode" ] == 0
+    assert agbench.count_features( out_path ) == 250
+    jsonl_path = os.path.join( agtool.home, "layer.jsonl" )
+    result = agtool( "export", "layer", "--out", jsonl_path, "--export-format", "jsonl" )
+    assert result[ "returncode" ] == 0
+    with open( jsonl_path, "r" ) as stream:
+        assert len( stream.readlines() ) == 250
+
+def test_info_async( portal, agtool ):
+    result = agtool( "info", "item0", "item1", "item2", "--async" )
+    assert result[ "returncode" ] == 0
+    ids = [ item[ "id" ] for item in json.loads( result[ "stdout" ].decode( "utf-8" ) ) ]
+    assert ids == [ portal.get_item( "item" + str( i ) )[ "id" ] for i in range( 3 ) ]